@@ -0,0 +1,302 @@
+# fakes.py
+#
+# Local stand-ins for the external services the agents call, so the pipeline can be
+# benchmarked offline and reproducibly:
+#   - FakeOllamaServer: HTTP server speaking the Ollama /api/chat protocol, with
+#     configurable first-token latency and token rate (streaming and non-streaming)
+#   - FakeWebServer: serves canned HTML news pages of a configurable size
+#   - FakeGoogleSearch: SerpAPI GoogleSearch replacement returning links to FakeWebServer
+#   - fake_yfinance: canned quotes (Ticker/Tickers/fast_info) and synthetic OHLC downloads
+
+import datetime as dt
+import json
+import re
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+import numpy as np
+import pandas as pd
+
+# ----------------------------
+# Ollama
+# ----------------------------
+PLANNER_RESPONSE = json.dumps({
+    "action": "use_tool",
+    "tools": [
+        {"tool": "csv", "details": "Analyse the sales data", "require_csv": True},
+        {"tool": "api_call", "details": "Fetch stock data for HSBC, UBS", "require_csv": False},
+        {"tool": "web_scrape", "details": "Research recent financial news", "require_csv": False},
+    ],
+})
+
+ANSWER_RESPONSE = json.dumps({
+    "answer": "Revenue grew steadily each quarter while HSBC and UBS traded near their yearly highs. "
+              "Recent coverage points to continued investment in data-driven forecasting.",
+    "reasoning": "Combined the CSV totals, the stock metrics and the summarised news articles.",
+    "confidence": 0.8,
+})
+
+SUMMARY_RESPONSE = ("The article reports steady growth across the UK financial sector, with banks "
+                    "benefiting from higher rates and improving loan demand.")
+
+def canned_completion(prompt: str) -> str:
+    """Pick a plausible response for each of the agents' prompt types."""
+    if "AI planner" in prompt:
+        return PLANNER_RESPONSE
+    page_ids = re.findall(r'<page id="(\w+)">', prompt)
+    if page_ids:
+        return json.dumps({"summaries": {page_id: SUMMARY_RESPONSE for page_id in page_ids}})
+    if "Return plain text" in prompt or "Return strictly plain text" in prompt:
+        return SUMMARY_RESPONSE
+    return ANSWER_RESPONSE
+
+class FakeOllamaServer:
+    """
+    Minimal Ollama API: /api/chat (streaming NDJSON or single JSON), /api/generate and /api/tags.
+    Every response waits first_token_latency seconds, then produces tokens at tokens_per_second.
+    """
+
+    def __init__(self, first_token_latency: float = 0.2, tokens_per_second: float = 200.0,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.first_token_latency = first_token_latency
+        self.tokens_per_second = tokens_per_second
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.startswith("/api/tags"):
+                    self._send_json({"models": [{"name": "gemma3:4b"}]})
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                server.requests += 1
+                if self.path.startswith("/api/chat"):
+                    prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+                    self._complete(body, canned_completion(prompt), lambda text: {"message": {"role": "assistant", "content": text}})
+                elif self.path.startswith("/api/generate"):
+                    self._complete(body, "" if not body.get("prompt") else SUMMARY_RESPONSE, lambda text: {"response": text})
+                else:
+                    self.send_error(404)
+
+            def _complete(self, body: dict, text: str, wrap):
+                model = body.get("model", "")
+                prompt_tokens = sum(len(m.get("content", "").split()) for m in body.get("messages", []))
+                tokens = [t + " " for t in text.split(" ")] if text else []
+                if tokens:
+                    tokens[-1] = tokens[-1][:-1]
+                time.sleep(server.first_token_latency)
+
+                if body.get("stream", True):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/x-ndjson")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    for token in tokens:
+                        time.sleep(1.0 / server.tokens_per_second)
+                        self._write_chunk({"model": model, "done": False, **wrap(token)})
+                    self._write_chunk({"model": model, "done": True, "prompt_eval_count": prompt_tokens,
+                                       "eval_count": len(tokens), **wrap("")})
+                    self.wfile.write(b"0\r\n\r\n")
+                else:
+                    time.sleep(len(tokens) / server.tokens_per_second)
+                    self._send_json({"model": model, "done": True, "prompt_eval_count": prompt_tokens,
+                                     "eval_count": len(tokens), **wrap(text)})
+
+            def _write_chunk(self, payload: dict):
+                data = (json.dumps(payload) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def _send_json(self, payload: dict):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        # Cancelled requests close the stream mid-generation
+        self._httpd.handle_error = lambda request, client_address: None
+        self.url = f"http://{host}:{self._httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+# ----------------------------
+# Web pages and search
+# ----------------------------
+def canned_html(page_id: int, paragraphs: int) -> str:
+    body = "".join(
+        f"<p>Paragraph {i} of article {page_id}: UK banks reported resilient earnings while "
+        f"analysts pointed to margin pressure and rising investment in technology.</p>"
+        for i in range(paragraphs)
+    )
+    return (f"<html><head><title>Article {page_id}</title><script>var x = 1;</script></head>"
+            f"<body><nav>menu</nav>{body}<footer>footer</footer></body></html>")
+
+class FakeWebServer:
+    """
+    Serves /page/<n> as an HTML news article of `paragraphs` paragraphs after `latency` seconds.
+    Conditional requests with a matching If-None-Match get 304 Not Modified.
+    """
+
+    def __init__(self, latency: float = 0.05, paragraphs: int = 200, host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.paragraphs = paragraphs
+        self.requests = 0
+        self.not_modified = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server.requests += 1
+                time.sleep(server.latency)
+                try:
+                    page_id = int(self.path.rstrip("/").rsplit("/", 1)[-1])
+                except ValueError:
+                    page_id = 0
+                etag = f'"page-{page_id}-{server.paragraphs}"'
+                if self.headers.get("If-None-Match") == etag:
+                    server.not_modified += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                data = canned_html(page_id, server.paragraphs).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(data)
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        # Clients that stop reading once they have enough text reset the connection
+        self._httpd.handle_error = lambda request, client_address: None
+        self.url = f"http://{host}:{self._httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+def make_fake_google_search(web_url: str, latency: float = 0.3):
+    """A GoogleSearch class whose results all point at pages on the fake web server."""
+
+    class FakeGoogleSearch:
+        calls = 0
+
+        def __init__(self, params: dict):
+            self.params = params
+
+        def get_dict(self) -> dict:
+            FakeGoogleSearch.calls += 1
+            time.sleep(latency)
+            num = int(self.params.get("num", 3))
+            return {"organic_results": [
+                {"link": f"{web_url}/page/{i}", "title": f"Article {i}", "snippet": f"Snippet {i}"}
+                for i in range(num)
+            ]}
+
+    return FakeGoogleSearch
+
+# ----------------------------
+# Yahoo Finance
+# ----------------------------
+def make_fake_yfinance(latency: float = 0.1):
+    """A module-like object with Ticker, Tickers and download backed by canned data."""
+    module = types.SimpleNamespace(calls=0)
+
+    class FakeFastInfo(dict):
+        def __init__(self, symbol: str):
+            seed = sum(map(ord, symbol))
+            price = 20 + seed % 80
+            super().__init__(
+                lastPrice=float(price), marketCap=float(price * 1e9), yearHigh=price * 1.2,
+                yearLow=price * 0.7, sharesOutstanding=1e9
+            )
+
+        def get(self, key, default=None):
+            # Each field read is a network round-trip in the real fast_info
+            module.calls += 1
+            time.sleep(latency)
+            return super().get(key, default)
+
+    class FakeTicker:
+        def __init__(self, symbol: str):
+            self.ticker = symbol.upper()
+            self.fast_info = FakeFastInfo(self.ticker)
+
+    class FakeTickers:
+        def __init__(self, symbols: str):
+            self.tickers = {s.upper(): FakeTicker(s) for s in symbols.split()}
+
+    def download(tickers, start=None, end=None, group_by=None, progress=True, **kwargs):
+        module.calls += 1
+        time.sleep(latency)
+        tickers = [tickers] if isinstance(tickers, str) else list(tickers)
+        end = end or dt.date.today()
+        start = start or end - dt.timedelta(days=180)
+        index = pd.bdate_range(start, pd.Timestamp(end) - pd.Timedelta(days=1), name="Date")
+        columns = pd.MultiIndex.from_product([tickers, ["Open", "High", "Low", "Close", "Volume"]])
+        rng = np.random.default_rng(0)
+        return pd.DataFrame(rng.uniform(10, 20, size=(len(index), len(columns))), index=index, columns=columns)
+
+    module.Ticker = FakeTicker
+    module.Tickers = FakeTickers
+    module.download = download
+    return module
+
+# ----------------------------
+# Installing the fakes
+# ----------------------------
+def install_fakes(ollama_url: str, web_url: str, search_latency: float = 0.3,
+                  yfinance_latency: float = 0.1, fake_yf: Optional[object] = None):
+    """
+    Point the agents at the local stand-ins. Must run after the agent modules are imported.
+    Charts are disabled, since they render in separate processes that don't see these patches.
+    """
+    import ollama
+    from agents import information_retrieval_agent, researcher_agent
+    from helpers import ohlc_store
+
+    ollama_client = ollama.Client(host=ollama_url)
+    ollama.chat = ollama_client.chat
+    ollama.generate = ollama_client.generate
+
+    researcher_agent.GoogleSearch = make_fake_google_search(web_url, latency=search_latency)
+
+    fake_yf = fake_yf or make_fake_yfinance(latency=yfinance_latency)
+    information_retrieval_agent.yf = fake_yf
+    ohlc_store.yf = fake_yf
+    information_retrieval_agent.visualize = lambda tickers, **kwargs: None
+    return fake_yf
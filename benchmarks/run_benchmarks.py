@@ -0,0 +1,229 @@
+# run_benchmarks.py
+#
+# Offline benchmark of the agent pipeline against the local stand-ins in fakes.py.
+#
+#   python benchmarks/run_benchmarks.py
+#   python benchmarks/run_benchmarks.py --scenarios analyze_csv,web_scrape --repeat 10 --json results.json
+#
+# Caches are disabled unless --warm-caches is given, in which case they live in a
+# temporary directory and the first repetition of each scenario warms them.
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = ["import_time", "load_csv", "analyze_csv", "fetch_stock_data", "web_scrape", "process_csv_and_question",
+             "planned_question"]
+
+def _configure_environment(warm_caches: bool, cache_dir: str):
+    """Cache settings are read at import time, so this runs before any agent module is imported."""
+    os.environ["LLM_CACHE"] = "1" if warm_caches else "0"
+    os.environ["QUOTE_CACHE"] = "1" if warm_caches else "0"
+    os.environ["LLM_CACHE_PATH"] = os.path.join(cache_dir, "llm_cache.sqlite3")
+    os.environ["QUOTE_CACHE_PATH"] = os.path.join(cache_dir, "quotes.sqlite3")
+    os.environ["CSV_CACHE_DIR"] = os.path.join(cache_dir, "csv")
+    os.environ["WEB_CACHE"] = "1" if warm_caches else "0"
+    os.environ["WEB_CACHE_PATH"] = os.path.join(cache_dir, "web.sqlite3")
+    os.environ["CONTEXT_DB_PATH"] = os.path.join(cache_dir, "context.sqlite3")
+    os.environ["OHLC_STORE_DIR"] = os.path.join(cache_dir, "ohlc")
+    os.environ["CHART_DIR"] = os.path.join(cache_dir, "charts")
+    os.environ.setdefault("MPLBACKEND", "Agg")
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+def measure(name: str, fn: Callable[[], object], repeat: int, items: int = 1) -> Dict[str, object]:
+    """Run fn `repeat` times and report latency percentiles and throughput (items per second)."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return summarize_timings(name, timings, items)
+
+def summarize_timings(name: str, timings: List[float], items: int = 1) -> Dict[str, object]:
+    total = sum(timings)
+    repeat = len(timings)
+    return {
+        "stage": name,
+        "runs": repeat,
+        "p50_ms": round(percentile(timings, 50) * 1000, 2),
+        "p95_ms": round(percentile(timings, 95) * 1000, 2),
+        "mean_ms": round(statistics.mean(timings) * 1000, 2),
+        "throughput_per_s": round(repeat * items / total, 2) if total else 0.0,
+    }
+
+def write_csv(path: str, rows: int):
+    """Synthetic sales export with a date, two categorical columns and two numeric columns."""
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(42)
+    pd.DataFrame({
+        "date": pd.date_range("2020-01-01", periods=rows, freq="h").strftime("%Y-%m-%d %H:%M"),
+        "region": rng.choice(["UK", "US", "EU", "APAC"], rows),
+        "product": rng.choice([f"product_{i}" for i in range(25)], rows),
+        "revenue": rng.uniform(10, 500, rows).round(2),
+        "units": rng.integers(1, 20, rows),
+    }).to_csv(path, index=False)
+
+# What a cold process pays before answering: the entry point, then each tool's first use
+IMPORT_TARGETS = [
+    ("orchestrator", "", "import orchestrator"),
+    ("tool=csv", "import orchestrator", "get_runner('csv')"),
+    ("tool=api_call", "import orchestrator", "get_runner('api_call')"),
+    ("tool=web_scrape", "import orchestrator", "get_runner('web_scrape')"),
+]
+
+IMPORT_SNIPPET = """
+import sys, time
+sys.path.insert(0, {src!r})
+{setup}
+from agents.tool_registry import get_runner
+start = time.perf_counter()
+{statement}
+print(time.perf_counter() - start)
+"""
+
+def measure_imports(repeat: int) -> List[Dict[str, object]]:
+    """Import time of each target, each run in a fresh interpreter so nothing is preloaded."""
+    results = []
+    for name, setup, statement in IMPORT_TARGETS:
+        code = IMPORT_SNIPPET.format(src=os.path.join(ROOT, "src"), setup=setup, statement=statement)
+        timings = []
+        for _ in range(repeat):
+            output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+            timings.append(float(output.stdout.strip().splitlines()[-1]))
+        results.append(summarize_timings(f"import_time[{name}]", timings))
+    return results
+
+def run(args) -> List[Dict[str, object]]:
+    from fakes import FakeOllamaServer, FakeWebServer, install_fakes
+
+    results = []
+    if "import_time" in args.scenarios:
+        results.extend(measure_imports(args.repeat))
+    with FakeOllamaServer(first_token_latency=args.llm_latency, tokens_per_second=args.token_rate) as llm, \
+            FakeWebServer(latency=args.page_latency, paragraphs=args.page_paragraphs) as web:
+        # Imported only now, after the environment is configured
+        from agents.data_analyst_agent import analyze_csv
+        from agents.information_retrieval_agent import fetch_stock_quotes
+        from agents.researcher_agent import web_scrape
+        from helpers.csv_loader import clear_csv_cache, load_csv
+        import orchestrator
+
+        install_fakes(llm.url, web.url, search_latency=args.search_latency, yfinance_latency=args.yf_latency)
+
+        csv_paths = {}
+        for rows in args.csv_rows:
+            path = os.path.join(args.work_dir, f"sales_{rows}.csv")
+            write_csv(path, rows)
+            csv_paths[rows] = path
+
+        def load_fresh(path):
+            if not args.warm_caches:
+                clear_csv_cache()
+            return load_csv(path, use_cache=args.warm_caches)
+
+        if "load_csv" in args.scenarios:
+            for rows, path in csv_paths.items():
+                results.append(measure(f"load_csv[rows={rows}]", lambda: load_fresh(path), args.repeat))
+
+        if "analyze_csv" in args.scenarios:
+            for rows, path in csv_paths.items():
+                df = load_csv(path)
+                results.append(measure(f"analyze_csv[rows={rows}]", lambda: analyze_csv(df), args.repeat))
+
+        if "fetch_stock_data" in args.scenarios:
+            symbols = ["HSBC", "UBS", "BARC", "LLOY", "NWG", "STAN", "JPM", "GS", "MS", "BCS",
+                       "DB", "CS", "BNP", "SAN", "ING", "ISP", "UCG", "NDA", "DNB", "SEB"]
+            for count in args.tickers:
+                batch = symbols[:count]
+                results.append(measure(f"fetch_stock_data[tickers={count}]",
+                                       lambda: fetch_stock_quotes(batch), args.repeat, items=count))
+
+        if "web_scrape" in args.scenarios:
+            for num in args.results:
+                results.append(measure(f"web_scrape[results={num}]",
+                                       lambda: web_scrape("UK banking sector news", num_results=num), args.repeat))
+
+        if "process_csv_and_question" in args.scenarios:
+            question = ("Based on the sales data, benchmark this against HSBC and UBS, researching recent "
+                        "financial news and getting real-time stock data.")
+            for rows, path in csv_paths.items():
+                results.append(measure(f"process_csv_and_question[rows={rows}]",
+                                       lambda: orchestrator.process_csv_and_question(path, question), args.repeat))
+
+        if "planned_question" in args.scenarios:
+            # Only weak keywords, so the LLM planner decides; compare with and without speculation
+            from agents import prefetch
+            question = "What is the outlook for the UK banking sector, and how does HSBC compare?"
+            path = csv_paths[min(csv_paths)]
+            for enabled in (False, True):
+                prefetch.SPECULATIVE_PREFETCH = enabled
+                results.append(measure(f"planned_question[prefetch={int(enabled)}]",
+                                       lambda: orchestrator.process_csv_and_question(path, question), args.repeat))
+
+        print(f"\nFake Ollama served {llm.requests} requests, fake web server {web.requests} pages "
+              f"({web.not_modified} not modified).")
+    return results
+
+def print_table(results: List[Dict[str, object]]):
+    headers = ["stage", "runs", "p50_ms", "p95_ms", "mean_ms", "throughput_per_s"]
+    widths = [max(len(h), *(len(str(r[h])) for r in results)) for h in headers]
+    print("  ".join(h.ljust(w) for h, w in zip(headers, widths)))
+    for row in results:
+        print("  ".join(str(row[h]).ljust(w) for h, w in zip(headers, widths)))
+
+def _int_list(text: str) -> List[int]:
+    return [int(x) for x in text.split(",") if x]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the agent pipeline.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"Comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per scenario")
+    parser.add_argument("--csv-rows", type=_int_list, default=[1_000, 100_000], help="CSV sizes, e.g. 1000,100000")
+    parser.add_argument("--tickers", type=_int_list, default=[1, 5, 20], help="Ticker counts for fetch_stock_data")
+    parser.add_argument("--results", type=_int_list, default=[3, 8], help="Search result counts for web_scrape")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Fake Ollama first-token latency (s)")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="Fake Ollama tokens per second")
+    parser.add_argument("--page-latency", type=float, default=0.05, help="Fake web page latency (s)")
+    parser.add_argument("--page-paragraphs", type=int, default=200, help="Paragraphs per fake web page")
+    parser.add_argument("--search-latency", type=float, default=0.3, help="Fake SerpAPI latency (s)")
+    parser.add_argument("--yf-latency", type=float, default=0.1, help="Fake Yahoo Finance latency per call (s)")
+    parser.add_argument("--warm-caches", action="store_true", help="Keep the LLM/quote/CSV/web caches enabled")
+    parser.add_argument("--json", metavar="FILE", help="Also write the results as JSON")
+    args = parser.parse_args()
+    args.scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+    with tempfile.TemporaryDirectory(prefix="agent-bench-") as work_dir:
+        args.work_dir = work_dir
+        _configure_environment(args.warm_caches, work_dir)
+        results = run(args)
+
+    print()
+    print_table(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
@@ -1,27 +1,318 @@
 # context_memory.py
 
+import contextvars
 import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+from helpers.prompt_builder import compact_json, prune_empty
 
-# In-memory store, resets each run
-_context_history = []
+# Budget for the rendered context that is pasted into prompts
+MAX_CONTEXT_BYTES = 8000
+# Prior interactions pasted into a prompt: the most relevant ones plus the latest
+CONTEXT_TOP_K = int(os.getenv("CONTEXT_TOP_K", "5"))
+# Oldest interactions of a session are deleted beyond this
+MAX_CONTEXT_ENTRIES = int(os.getenv("MAX_CONTEXT_ENTRIES", "5000"))
+# Sessions idle for longer than this are deleted (the CLI's default session is kept)
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+# Oldest interactions across all sessions are deleted beyond this
+MAX_TOTAL_CONTEXT_ENTRIES = int(os.getenv("MAX_TOTAL_CONTEXT_ENTRIES", "100000"))
+# Expired sessions are looked for at most this often, on save
+EXPIRE_INTERVAL_SECONDS = 60.0
+# Length of the digest an interaction is compacted into when the full text doesn't fit
+DIGEST_CHARS = 200
+# Tool output text indexed per interaction
+MAX_INDEXED_CHARS = 20_000
+
+CONTEXT_PERSIST = os.getenv("CONTEXT_PERSIST", "1") != "0"
+CONTEXT_DB_PATH = os.getenv("CONTEXT_DB_PATH", os.path.join(".cache", "context.sqlite3"))
+
+DEFAULT_SESSION = "default"
+
+STOPWORDS = {
+    "the", "a", "an", "and", "or", "of", "to", "in", "on", "for", "with", "is", "are", "was", "were",
+    "be", "this", "that", "these", "those", "it", "its", "as", "at", "by", "from", "about", "what",
+    "how", "which", "who", "our", "we", "you", "your", "me", "my", "do", "does", "did", "can", "could",
+    "please", "give", "get", "based", "against", "into", "than", "then", "also", "all", "any",
+}
+
+def _render_full(question: str, tool_outputs: dict) -> str:
+    text = f"Q: {question}\n   A: {compact_json(prune_empty(tool_outputs))}\n"
+    # A single oversized interaction must not blow the whole budget on its own
+    return text if len(text) <= MAX_CONTEXT_BYTES else text[:MAX_CONTEXT_BYTES - 15] + "... (truncated)\n"
+
+def _render_digest(question: str, tool_outputs: dict) -> str:
+    """Short one-line summary of an interaction: the question plus a snippet per tool."""
+    parts = []
+    for tool, output in tool_outputs.items():
+        answer = output.get("answer") if isinstance(output, dict) and "answer" in output else output
+        snippet = json.dumps(answer, ensure_ascii=False, default=str)
+        parts.append(f"{tool}: {snippet[:DIGEST_CHARS // 2]}")
+    digest = f"Q: {question[:DIGEST_CHARS]} | " + "; ".join(parts)
+    return digest[:DIGEST_CHARS * 2] + " (compacted)\n"
+
+def _indexed_text(value) -> str:
+    """The string leaves of the tool outputs (answers, summaries, titles), for the search index."""
+    parts: List[str] = []
+
+    def walk(node):
+        if isinstance(node, str):
+            parts.append(node)
+        elif isinstance(node, dict):
+            for child in node.values():
+                walk(child)
+        elif isinstance(node, (list, tuple)):
+            for child in node:
+                walk(child)
+        elif node is not None:
+            parts.append(str(node))
+
+    walk(value)
+    return " ".join(parts)[:MAX_INDEXED_CHARS]
+
+def _match_query(question: str) -> Optional[str]:
+    """An FTS5 OR-query of the question's content words, quoted so punctuation can't break it."""
+    words = dict.fromkeys(
+        w for w in re.findall(r"\w+", question.lower())
+        if len(w) > 1 and w not in STOPWORDS
+    )
+    return " OR ".join(f'"{w}"' for w in words) or None
+
+# ----------------------------
+# Store
+# ----------------------------
+class ContextStore:
+    """
+    SQLite store of past interactions per session, with an FTS5 index over questions and
+    tool outputs so prompts get the BM25 top-k relevant interactions rather than all of them.
+    Without FTS5 in the local SQLite build it falls back to the most recent interactions.
+    """
+
+    def __init__(self, path: str = CONTEXT_DB_PATH if CONTEXT_PERSIST else ":memory:"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.fts_available = True
+        self._expired_at = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.path != ":memory:" and os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS interactions ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, session TEXT NOT NULL, created_at REAL NOT NULL, "
+                "question TEXT NOT NULL, text TEXT NOT NULL, digest TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS interactions_session ON interactions (session, id)")
+            try:
+                conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS interactions_fts "
+                    "USING fts5(session UNINDEXED, question, body)"
+                )
+            except sqlite3.OperationalError:
+                self.fts_available = False
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def save(self, session: str, question: str, tool_outputs: dict):
+        with self._lock:
+            conn = self._connect()
+            cursor = conn.execute(
+                "INSERT INTO interactions (session, created_at, question, text, digest) VALUES (?, ?, ?, ?, ?)",
+                (session, time.time(), question, _render_full(question, tool_outputs),
+                 _render_digest(question, tool_outputs))
+            )
+            if self.fts_available:
+                conn.execute(
+                    "INSERT INTO interactions_fts (rowid, session, question, body) VALUES (?, ?, ?, ?)",
+                    (cursor.lastrowid, session, question, _indexed_text(tool_outputs))
+                )
+            self._prune(conn, session)
+            if time.monotonic() - self._expired_at >= EXPIRE_INTERVAL_SECONDS:
+                self._expire(conn)
+            conn.commit()
+
+    def _prune(self, conn: sqlite3.Connection, session: str):
+        stale = [row[0] for row in conn.execute(
+            "SELECT id FROM interactions WHERE session = ? ORDER BY id DESC LIMIT -1 OFFSET ?",
+            (session, MAX_CONTEXT_ENTRIES)
+        )]
+        self._delete(conn, stale)
+
+    def _expire(self, conn: sqlite3.Connection, now: Optional[float] = None):
+        """
+        Delete idle sessions and cap the total size. Every anonymous server request gets its
+        own session, so per-session pruning alone would let the database grow without bound.
+        """
+        self._expired_at = time.monotonic()
+        cutoff = (now or time.time()) - SESSION_TTL_SECONDS
+        stale = [row[0] for row in conn.execute(
+            "SELECT id FROM interactions WHERE session IN ("
+            "SELECT session FROM interactions WHERE session != ? GROUP BY session HAVING MAX(created_at) < ?)",
+            (DEFAULT_SESSION, cutoff)
+        )]
+        stale += [row[0] for row in conn.execute(
+            "SELECT id FROM interactions ORDER BY id DESC LIMIT -1 OFFSET ?", (MAX_TOTAL_CONTEXT_ENTRIES,)
+        )]
+        self._delete(conn, sorted(set(stale)))
+
+    def _delete(self, conn: sqlite3.Connection, ids: List[int]):
+        for start in range(0, len(ids), 500):  # stay under SQLite's bound-parameter limit
+            chunk = ids[start:start + 500]
+            marks = ",".join("?" * len(chunk))
+            conn.execute(f"DELETE FROM interactions WHERE id IN ({marks})", chunk)
+            if self.fts_available:
+                conn.execute(f"DELETE FROM interactions_fts WHERE rowid IN ({marks})", chunk)
+
+    def recent(self, session: str, k: int) -> List[int]:
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT id FROM interactions WHERE session = ? ORDER BY id DESC LIMIT ?", (session, k)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def search(self, session: str, question: str, k: int) -> List[int]:
+        """Ids of the k interactions of a session most relevant to the question, best first."""
+        query = _match_query(question)
+        if not query or not self.fts_available:
+            return []
+        with self._lock:
+            try:
+                rows = self._connect().execute(
+                    "SELECT rowid FROM interactions_fts WHERE interactions_fts MATCH ? AND session = ? "
+                    "ORDER BY bm25(interactions_fts, 0.0, 2.0, 1.0), rowid DESC LIMIT ?",
+                    (query, session, k)
+                ).fetchall()
+            except sqlite3.OperationalError:
+                return []
+        return [row[0] for row in rows]
+
+    def entries(self, ids: List[int]) -> List[dict]:
+        """The given interactions in chronological order."""
+        if not ids:
+            return []
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT id, question, text, digest FROM interactions WHERE id IN ({','.join('?' * len(ids))}) "
+                "ORDER BY id", ids
+            ).fetchall()
+        return [{"id": i, "question": q, "text": t, "digest": d} for i, q, t, d in rows]
+
+    def count(self, session: str) -> int:
+        with self._lock:
+            return self._connect().execute(
+                "SELECT COUNT(*) FROM interactions WHERE session = ?", (session,)
+            ).fetchone()[0]
+
+    def clear(self, session: Optional[str] = None):
+        with self._lock:
+            conn = self._connect()
+            if session is None:
+                conn.execute("DELETE FROM interactions")
+                if self.fts_available:
+                    conn.execute("DELETE FROM interactions_fts")
+            else:
+                conn.execute("DELETE FROM interactions WHERE session = ?", (session,))
+                if self.fts_available:
+                    conn.execute("DELETE FROM interactions_fts WHERE session = ?", (session,))
+            conn.commit()
+
+def _render(entries: List[dict]) -> str:
+    """Full text while it fits the byte budget, most relevant first; digests after that."""
+    budget = MAX_CONTEXT_BYTES
+    rendered = {}
+    for entry in sorted(entries, key=lambda e: e["rank"]):
+        for text in (entry["text"], entry["digest"]):
+            size = len(text.encode("utf-8"))
+            if size <= budget:
+                rendered[entry["id"]] = text
+                budget -= size
+                break
+    kept = [entry for entry in entries if entry["id"] in rendered]
+    return "Previous interactions:\n" + "".join(
+        f"{i}. {rendered[entry['id']]}" for i, entry in enumerate(kept, 1)
+    )
+
+class ContextMemory:
+    """One session's view of the context store."""
+
+    def __init__(self, session_id: str, store: ContextStore):
+        self.session_id = session_id
+        self.store = store
+
+    def save(self, question: str, tool_outputs: dict):
+        self.store.save(self.session_id, question, tool_outputs)
+
+    def text(self, question: Optional[str] = None, k: int = CONTEXT_TOP_K) -> str:
+        """
+        Past interactions for a prompt. With a question, the k most relevant ones plus the
+        latest (for follow-ups); otherwise the k most recent. Shown in chronological order.
+        """
+        ranked = self.store.search(self.session_id, question, k) if question else []
+        # Nothing relevant (or no index): fall back to the most recent interactions
+        recent = self.store.recent(self.session_id, 1 if ranked else k)
+        if not recent:
+            return "No previous context."
+        ids = list(dict.fromkeys(ranked + recent))
+        # Earlier in the list gets the full-text budget first: by relevance, else newest first
+        rank = {entry_id: i for i, entry_id in enumerate(ids)}
+        entries = self.store.entries(ids)
+        for entry in entries:
+            entry["rank"] = rank[entry["id"]]
+        return _render(entries)
+
+    def clear(self):
+        self.store.clear(self.session_id)
+
+# ----------------------------
+# Sessions
+# ----------------------------
+_store = ContextStore()
+_current_session: contextvars.ContextVar[str] = contextvars.ContextVar("context_session", default=DEFAULT_SESSION)
+
+def get_context_store() -> ContextStore:
+    return _store
+
+def get_memory(session_id: Optional[str] = None) -> ContextMemory:
+    """Return the memory of a session (the current one by default)."""
+    return ContextMemory(session_id or _current_session.get(), _store)
+
+@contextmanager
+def use_session(session_id: str) -> Iterator[str]:
+    """Route save_context/get_context_text in this context (and threads bound to it) to one session."""
+    token = _current_session.set(session_id)
+    try:
+        yield session_id
+    finally:
+        _current_session.reset(token)
+
+def current_session() -> str:
+    return _current_session.get()
 
 def save_context(question: str, tool_outputs: dict):
     """
-    Append the latest run (question + tool outputs) into the in-memory context.
+    Append the latest run (question + tool outputs) to the current session's context.
+    The prompt text for the entry is rendered once here, not on every read.
     """
-    _context_history.append({
-        "question": question,
-        "tool_outputs": tool_outputs
-    })
+    get_memory().save(question, tool_outputs)
 
-def get_context_text() -> str:
+def get_context_text(question: Optional[str] = None) -> str:
     """
-    Return past context as a readable string for prompts.
+    Return past context as a readable string for prompts: the interactions most
+    relevant to `question` (plus the latest), or the most recent ones without it.
     """
-    if not _context_history:
-        return "No previous context."
-    
-    text = "Previous interactions:\n"
-    for i, h in enumerate(_context_history, 1):
-        text += f"{i}. Q: {h['question']}\n   A: {json.dumps(h['tool_outputs'], indent=2)}\n"
-    return text
+    return get_memory().text(question)
+
+def clear_context(session_id: Optional[str] = None):
+    """Forget all previous interactions of a session (the current one by default)."""
+    get_memory(session_id).clear()
+
+def drop_session(session_id: str):
+    get_memory(session_id).clear()
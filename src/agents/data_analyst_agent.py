@@ -1,9 +1,9 @@
 import pandas as pd
-import ollama
-import json
 from pydantic import BaseModel
-from helpers.llm_utils import clean_llm_json
-from typing import Any, Optional, List
+from helpers.llm_client import chat_json
+from helpers.csv_profile import summarize_dataframe
+from helpers.tracing import log_status
+from typing import Any, Optional
 
 class DirectAnswer(BaseModel):
     answer: Any
@@ -11,11 +11,12 @@ class DirectAnswer(BaseModel):
     confidence: float
 
 def analyze_csv(df: pd.DataFrame) -> DirectAnswer:
-    csv_text = df.to_csv(index=False) if df is not None else "No CSV data"
+    # A fixed-size profile instead of the raw rows, so prompt size doesn't grow with the file
+    csv_text = summarize_dataframe(df)
     prompt = f"""
-You are a data analyst AI. Analyze the CSV data below and provide a summary of the company's performance.
+You are a data analyst AI. Analyze the CSV profile below and provide a summary of the company's performance.
 
-CSV Data:
+CSV Profile:
 {csv_text}
 
 Rules:
@@ -27,10 +28,19 @@ Rules:
 }}
 - Include totals, averages, or trends if relevant.
 """
-    response = ollama.chat(
-        model="gemma3:4b",
-        messages=[{"role": "user", "content": prompt}]
+    return chat_json(
+        DirectAnswer,
+        messages=[{"role": "user", "content": prompt}],
+        task="analyze_csv"
     )
-    raw_output = clean_llm_json(response["message"]["content"].strip())
-    parsed = json.loads(raw_output)
-    return DirectAnswer(**parsed)
+
+def run_csv_tool(question: str, tool: Any, data: Optional[pd.DataFrame] = None, parallel: bool = True) -> dict:
+    """Tool runner for "csv" (see agents.tool_registry)."""
+    res = analyze_csv(df=data)
+    log_status("40% COMPLETED", "CSV analysis complete")
+    return res.dict()
+
+def prefetch_csv_tool(question: str, data: Optional[pd.DataFrame] = None):
+    """Speculative part of "csv": the profile, which analyze_csv and the planner prompt reuse."""
+    if data is not None:
+        summarize_dataframe(data)
@@ -2,11 +2,15 @@
 
 import json
 from pydantic import BaseModel
-from typing import Any
+from typing import Any, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
 import yfinance as yf
-import ollama
 # from helpers.llm_utils import clean_llm_json
-from helpers.stock_plot import visualize
+from helpers.llm_client import cached_chat
+from helpers.singleflight import SingleFlight
+from helpers.tracing import bind, log_status, span
+from helpers.tickers import find_tickers
+from helpers.quote_cache import QUOTE_CACHE_ENABLED, QUOTE_FIELDS, get_quote_cache
 
 # ----------------------------
 # Schemas
@@ -19,48 +23,161 @@ class DirectAnswer(BaseModel):
 # ----------------------------
 # Fetch stock data safely
 # ----------------------------
+MAX_QUOTE_WORKERS = 8
+FALLBACK_FIN_TICKERS = ["HSBC", "UBS"]
+
+def extract_tickers(text: str) -> list[str]:
+    """Tickers named in the text, or the fallback pair when there are none (the tool always fetches something)."""
+    return find_tickers(text) or FALLBACK_FIN_TICKERS[:2]
+
+def visualize(tickers: List[str], **kwargs):
+    """Queue candlestick charts; matplotlib is only imported once a chart is drawn."""
+    from helpers.stock_plot import visualize as render_in_background
+    return render_in_background(tickers, **kwargs)
+
+# Not memoised per batch: the quote cache already keeps quotes for QUOTE_TTL_SECONDS
+_quote_flight = SingleFlight("quotes", batch_scope=False)
+
+def _read_fast_info(ticker: str, stock: Any, fields: List[str]) -> Dict[str, Any]:
+    """Read only the requested fast_info fields (each one is a lazy network lookup)."""
+    fast = stock.fast_info
+    if not fast or fast.get("lastPrice") is None:
+        return {}
+    return {field: fast.get(field) for field in fields}
+
+def _quote_answer(ticker: str, values: Dict[str, Any]) -> DirectAnswer:
+    key_data = {"symbol": ticker.upper(), **{field: values.get(field) for field in QUOTE_FIELDS}}
+    return DirectAnswer(
+        answer=key_data,
+        reasoning=f"Fetched Yahoo Finance fast_info data for ticker '{ticker}'.",
+        confidence=0.95
+    )
+
+def _fetch_fast_info_batch(missing: Dict[str, List[str]], max_workers: int) -> Dict[str, Any]:
+    """Read the given fields for each ticker from one yf.Tickers batch; failures come back as exceptions."""
+    fetched: Dict[str, Any] = {}
+    with span("yfinance.quotes", "yfinance", tickers=list(missing),
+              fields=sum(len(fields) for fields in missing.values())) as s:
+        try:
+            batch = yf.Tickers(" ".join(missing))
+            stocks = {ticker: batch.tickers.get(ticker.upper()) or yf.Ticker(ticker) for ticker in missing}
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(missing)))) as pool:
+                futures = {
+                    ticker: pool.submit(bind(_read_fast_info), ticker, stocks[ticker], fields)
+                    for ticker, fields in missing.items()
+                }
+                for ticker, future in futures.items():
+                    try:
+                        fetched[ticker] = future.result()
+                    except Exception as e:
+                        fetched[ticker] = e
+        except Exception as e:
+            fetched = {ticker: e for ticker in missing}
+        s.set(failed=[ticker for ticker, value in fetched.items() if isinstance(value, Exception)])
+    return fetched
+
+def fetch_stock_quotes(tickers: List[str], max_workers: int = MAX_QUOTE_WORKERS,
+                       use_cache: bool = True) -> Dict[str, DirectAnswer]:
+    """
+    Fetch quotes for several tickers in one pass. Fields still fresh in the quote cache
+    are not re-fetched; the rest are read concurrently from a single yf.Tickers batch.
+    """
+    use_cache = use_cache and QUOTE_CACHE_ENABLED
+    cache = get_quote_cache()
+    results: Dict[str, DirectAnswer] = {}
+    cached_values: Dict[str, Dict[str, Any]] = {}
+    missing: Dict[str, List[str]] = {}
+
+    for ticker in tickers:
+        fresh = cache.get(ticker.upper()) if use_cache else {}
+        cached_values[ticker] = fresh
+        stale = [field for field in QUOTE_FIELDS if field not in fresh]
+        if stale:
+            missing[ticker] = stale
+        else:
+            results[ticker] = _quote_answer(ticker, fresh)
+
+    if missing:
+        # Tickers another thread is already fetching (or that this request already
+        # fetched) are waited on instead of requested twice
+        keys = {(ticker.upper(), tuple(fields)): ticker for ticker, fields in missing.items()}
+        mine, others = _quote_flight.claim(keys)
+        own = {keys[key]: list(key[1]) for key in mine}
+        fetched = _fetch_fast_info_batch(own, max_workers) if own else {}
+        for key in mine:
+            value = fetched[keys[key]]
+            if isinstance(value, Exception):
+                _quote_flight.fail(key, value)  # not memoised: the next caller retries
+            else:
+                _quote_flight.resolve(key, value)
+        for key, future in others.items():
+            try:
+                fetched[keys[key]] = future.result()
+            except Exception as e:
+                fetched[keys[key]] = e
+
+        refreshed = []
+        for ticker in missing:
+            values = fetched.get(ticker)
+            if isinstance(values, Exception):
+                log_status("QUOTES", f"Error fetching data for ticker {ticker}: {values}")
+                results[ticker] = DirectAnswer(
+                    answer={},
+                    reasoning=f"Error fetching data for ticker '{ticker}': {values}",
+                    confidence=0.0
+                )
+            elif not values:
+                log_status("QUOTES", f"No financial data found for ticker {ticker}")
+                results[ticker] = DirectAnswer(
+                    answer={},
+                    reasoning=f"No financial data found for ticker '{ticker}' (possibly invalid or delisted)",
+                    confidence=0.0
+                )
+            else:
+                results[ticker] = _quote_answer(ticker, {**cached_values[ticker], **values})
+                if ticker in own:
+                    if use_cache:
+                        cache.put(ticker.upper(), values)
+                    refreshed.append(ticker)
+
+        # Charts render in a background process (see helpers.stock_plot), and only
+        # for quotes that actually came from the network
+        if refreshed:
+            try:
+                visualize(refreshed)
+            except Exception as e:
+                log_status("CHARTS", f"Unable to plot stock data: {e}")
+
+    return {ticker: results[ticker] for ticker in tickers}
 
 def fetch_stock_data(ticker: str) -> DirectAnswer:
     """
     Fetch stock data from Yahoo Finance for the given ticker using fast_info.
     Returns a summary with all key metrics.
     """
-    try:
-        stock = yf.Ticker(ticker)
-        fast = stock.fast_info
-
-        if not fast or fast.get("lastPrice") is None:
-            print("No financial data found for ticker:", ticker)
-            return DirectAnswer(
-                answer={},
-                reasoning=f"No financial data found for ticker '{ticker}' (possibly invalid or delisted)",
-                confidence=0.0
-            )
-
-        key_data = {
-            "symbol": ticker.upper(),
-            "lastPrice": fast.get("lastPrice"),
-            "marketCap": fast.get("marketCap"),
-            "yearHigh": fast.get("yearHigh"),
-            "yearLow": fast.get("yearLow"),
-            "sharesOutstanding": fast.get("sharesOutstanding"),
-        }
-
-        visualize([ticker])
-
-        return DirectAnswer(
-            answer=key_data,
-            reasoning=f"Fetched Yahoo Finance fast_info data for ticker '{ticker}'.",
-            confidence=0.95
-        )
+    return fetch_stock_quotes([ticker])[ticker]
 
-    except Exception as e:
-        print("Error fetching data for ticker:", ticker)
-        return DirectAnswer(
-            answer={},
-            reasoning=f"Error fetching data for ticker '{ticker}': {e}",
-            confidence=0.0
-        )
+def run_api_call_tool(question: str, tool: Any, data: Optional[Any] = None, parallel: bool = True) -> dict:
+    """Tool runner for "api_call" (see agents.tool_registry)."""
+    tickers = extract_tickers(tool.details or question)
+    log_status("45% COMPLETED", f"Ticker(s) extracted: {tickers}")
+
+    results = fetch_stock_quotes(tickers, max_workers=MAX_QUOTE_WORKERS if parallel else 1)
+
+    api_results = {ticker: res.dict() for ticker, res in results.items()}
+    found = [ticker for ticker, res in results.items() if res.answer]
+    missing = [ticker for ticker in results if ticker not in found]
+    log_status("50% COMPLETED", f"Stock data found for {found}" + (f", not found for {missing}" if missing else ""))
+    return api_results
+
+def prefetch_api_call_tool(question: str, data: Optional[Any] = None):
+    """
+    Speculative part of "api_call": quotes for ticker-like words in the question. The tool
+    picks them up from the request memo for whichever of them the plan asks for.
+    """
+    tickers = find_tickers(question)
+    if tickers:
+        fetch_stock_quotes(tickers)
 
 # ----------------------------
 # Format stock data for LLM
@@ -83,7 +200,7 @@ def format_stock_data(key_data: dict) -> str:
 # ----------------------------
 def summarize_stock(ticker: str) -> str:
     """
-    Summarize the stock data using LLM (gemma3:4b), including all key metrics.
+    Summarize the stock data using the summarize_stock model, including all key metrics.
     """
     result = fetch_stock_data(ticker)
     if not result.answer:
@@ -99,9 +216,9 @@ You are a financial analyst. Analyse this stock data in detail, include all key
 Return strictly plain text.
 """
     try:
-        response = ollama.chat(
-            model="gemma3:4b",
-            messages=[{"role": "user", "content": prompt}]
+        response = cached_chat(
+            messages=[{"role": "user", "content": prompt}],
+            task="summarize_stock"
         )
         return response["message"]["content"].strip()
     except Exception as e:
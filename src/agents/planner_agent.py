@@ -1,18 +1,26 @@
 # planner_agent.py
 
-import pandas as pd
 import json
 import re
-import random
-from pydantic import BaseModel
-from typing import Any, Optional, List
-import yfinance as yf
-import ollama
-from agents.data_analyst_agent import analyze_csv
-from agents.researcher_agent import web_scrape
+import time
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from pydantic import BaseModel, ValidationError
+from typing import TYPE_CHECKING, Any, Callable, Optional, List
 from agents.context_memory import save_context, get_context_text
-from agents.information_retrieval_agent import fetch_stock_data
-from helpers.llm_utils import clean_llm_json
+from agents.tool_registry import ToolSpec, get_runner, get_tool, tool_specs
+from helpers.llm_client import cached_chat, chat_json, parse_into, stream_chat
+from helpers.llm_scheduler import CancelScope, LLMCancelled, run_cancellable
+from helpers.json_stream import StreamingFieldParser
+from helpers.model_config import get_model_config
+from helpers.prompt_builder import PromptBuilder, compact_json, prune_empty
+from helpers.tickers import find_tickers
+from helpers.tracing import bind, current_span, log_status, span
+
+# pandas and the tool modules (yfinance, bs4, serpapi, matplotlib, ...) are imported on
+# first use, so starting up for a question that needs none of them stays cheap
+if TYPE_CHECKING:
+    import pandas as pd
 
 # ----------------------------
 # Schemas
@@ -30,84 +38,30 @@ class ToolCall(BaseModel):
 class MultiToolCall(BaseModel):
     action: str
     tools: List[ToolCall]
-
-class ToolSpec(BaseModel):
-    name: str
-    description: str
-    requires_csv: bool = False
+    route: Optional[str] = None  # "rules" or "llm": which planner picked the tools
+    route_confidence: Optional[float] = None
 
 # ----------------------------
 # Tools
 # ----------------------------
-available_tools: List[ToolSpec] = [
-    ToolSpec(name="csv", description="Analyze uploaded CSV data for totals, averages, metrics.", requires_csv=True),
-    ToolSpec(name="web_scrape", description="Research online news or updates about a topic.", requires_csv=False),
-    ToolSpec(name="api_call", description="Fetch stock/market/company data from Yahoo Finance.", requires_csv=False)
-]
+# Tools are registered in agents.tool_registry; fields of ToolSpec that are shown to the LLM planner
+TOOL_PROMPT_FIELDS = {"name", "description", "requires_csv"}
 
 # ----------------------------
 # CSV loader
 # ----------------------------
-def handle_csv_upload(file_path: str) -> pd.DataFrame:
+def handle_csv_upload(file_path: str, use_cache: bool = True) -> "pd.DataFrame":
+    from helpers.csv_loader import load_csv
     try:
-        return pd.read_csv(file_path)
+        return load_csv(file_path, use_cache=use_cache)
     except Exception as e:
         raise ValueError(f"Error reading CSV file: {e}")
 
-# ----------------------------
-# Ticker extraction
-# ----------------------------
-FALLBACK_FIN_TICKERS = ["HSBC", "UBS"]
-
-def extract_tickers(text: str) -> list[str]:
-    tickers = re.findall(r'\b[A-Z]{1,5}\b', text)
-    valid_tickers = [t for t in tickers if t not in ["API"]]
-    if not valid_tickers:
-        valid_tickers = random.sample(FALLBACK_FIN_TICKERS, k=min(2, len(FALLBACK_FIN_TICKERS)))
-    return list(set(valid_tickers))
-
-# ----------------------------
-# Fetch stock data
-# ----------------------------
-
-"""
-
-def fetch_stock_data(ticker: str) -> DirectAnswer:
-    try:
-        stock = yf.Ticker(ticker)
-        fast = stock.fast_info
-
-        if not fast or fast.get("lastPrice") is None:
-            return DirectAnswer(
-                answer={},
-                reasoning=f"No financial data found for ticker '{ticker}' (possibly invalid or delisted)",
-                confidence=0.0
-            )
-
-        key_data = {
-            "symbol": ticker.upper(),
-            "lastPrice": fast.get("lastPrice"),
-            "marketCap": fast.get("marketCap"),
-            "yearHigh": fast.get("yearHigh"),
-            "yearLow": fast.get("yearLow"),
-            "sharesOutstanding": fast.get("sharesOutstanding"),
-        }
-
-        return DirectAnswer(answer=key_data, reasoning=f"Fetched Yahoo Finance fast_info data for ticker '{ticker}'.", confidence=0.95)
-
-    except Exception as e:
-        return DirectAnswer(
-            answer={},
-            reasoning=f"Error fetching data for ticker '{ticker}': {e}",
-            confidence=0.0
-        )
-
-"""
-
 # ----------------------------
 # Summarize stock (optional)
 # ----------------------------
 def summarize_stock(ticker: str) -> str:
+    from agents.information_retrieval_agent import fetch_stock_data
     result = fetch_stock_data(ticker)
     if not result.answer:
         return f"Cannot summarize: {result.reasoning}"
@@ -120,19 +74,98 @@ You are a financial analyst. Analyse this stock data in lots of detail, include
 Return strictly plain text.
 """
     try:
-        response = ollama.chat(model="gemma3:4b", messages=[{"role": "user", "content": prompt}])
+        response = cached_chat(messages=[{"role": "user", "content": prompt}], task="summarize_stock")
         return response["message"]["content"].strip()
     except Exception as e:
-        print("Unable to summarise stock data:")
+        log_status("TOOLS", f"Unable to summarise stock data: {e}")
         return f"Unable to summarise stock data: {e}"
 
+# ----------------------------
+# Rule-based router
+# ----------------------------
+# Below this confidence the LLM planner makes the decision instead
+ROUTER_CONFIDENCE_THRESHOLD = 0.75
+
+@lru_cache(maxsize=None)
+def _keyword_pattern(keywords: tuple) -> Optional["re.Pattern"]:
+    if not keywords:
+        return None
+    # Prefix match, so "trend" also covers "trends"/"trending"
+    return re.compile(r"\b(?:" + "|".join(re.escape(k) for k in keywords) + r")\w*", re.IGNORECASE)
+
+def _tool_match(spec: ToolSpec, question: str, data: Optional["pd.DataFrame"]) -> Optional[str]:
+    """Return "strong" if the rules select the tool, "weak" if they only suggest it, else None."""
+    if spec.requires_csv and data is None:
+        return None
+    strong = _keyword_pattern(tuple(spec.keywords))
+    weak = _keyword_pattern(tuple(spec.weak_keywords))
+    if strong and strong.search(question):
+        # "market cap of Apple": only the LLM planner can turn a company name into a ticker
+        if spec.name == "api_call" and not find_tickers(question):
+            return "weak"
+        return "strong"
+    # A loaded CSV alone doesn't mean the question is about it ("Is Nvidia a good buy?")
+    if spec.requires_csv:
+        return "weak"
+    # A bare all-caps word may be an acronym (ECB, KPI, ROI), so it only suggests api_call
+    if (weak and weak.search(question)) or (spec.name == "api_call" and find_tickers(question)):
+        return "weak"
+    return None
+
+def route_tools(question: str, data: Optional["pd.DataFrame"] = None,
+                tools: Optional[List[ToolSpec]] = None) -> MultiToolCall:
+    """
+    Pick tools from the ToolSpec keywords without calling the LLM.
+    A tool is selected on a strong keyword (for api_call, together with a ticker-like word).
+    Weak keywords, a bare ticker-like word, a stock keyword without a ticker, or a loaded
+    CSV the question doesn't mention leave the decision open and lower route_confidence.
+    """
+    tools = tools if tools is not None else tool_specs()
+    selected: List[ToolCall] = []
+    undecided = 0
+
+    for spec in tools:
+        match = _tool_match(spec, question, data)
+        if match == "strong":
+            # api_call is only decisive with tickers, so its details always name them
+            details = (f"Fetch stock data for: {', '.join(find_tickers(question))}" if spec.name == "api_call"
+                       else spec.description)
+            selected.append(ToolCall(tool=spec.name, details=details, require_csv=spec.requires_csv))
+        elif match == "weak":
+            undecided += 1
+
+    if undecided:
+        confidence = 0.5
+    elif not selected:
+        confidence = 0.3
+    else:
+        confidence = 1.0
+    return MultiToolCall(action="use_tool", tools=selected, route="rules", route_confidence=confidence)
+
+def likely_tools(question: str, data: Optional["pd.DataFrame"] = None) -> List[str]:
+    """Tools the rules select or suggest: the candidates worth prefetching for the LLM planner."""
+    return [spec.name for spec in tool_specs() if _tool_match(spec, question, data)]
+
 # ----------------------------
 # Select tools dynamically
 # ----------------------------
-def select_tools(question: str, data: Optional[pd.DataFrame] = None) -> MultiToolCall:
-    data_summary = data.to_csv(index=False) if data is not None else ""
-    csv_text = f"CSV data:\n{data_summary}" if data_summary else "No CSV provided."
-    tools_json = json.dumps([tool.dict() for tool in available_tools], indent=2)
+def select_tools(question: str, data: Optional["pd.DataFrame"] = None,
+                 use_router: bool = True) -> MultiToolCall:
+    """
+    Choose tools for the question. The rule-based router answers confidently for most
+    questions; the LLM planner is only called when it can't.
+    """
+    if use_router:
+        routed = route_tools(question, data)
+        if routed.route_confidence >= ROUTER_CONFIDENCE_THRESHOLD:
+            return routed
+
+    if data is not None:
+        from helpers.csv_profile import summarize_dataframe
+        csv_text = f"CSV profile:\n{summarize_dataframe(data)}"
+    else:
+        csv_text = "No CSV provided."
+    tools_json = json.dumps([tool.dict(include=TOOL_PROMPT_FIELDS) for tool in tool_specs()], indent=2)
 
     prompt = f"""
 You are an AI planner. Based on the CSV and the question below, decide which tools to use.
@@ -159,106 +192,194 @@ Rules:
 - Include "web_scrape" if the question asks about news or trends.
 - Return valid JSON only.
 """
-    response = ollama.chat(model="gemma3:4b", messages=[{"role": "user", "content": prompt}])
-    raw_output = clean_llm_json(response["message"]["content"].strip())
-
     try:
-        parsed = json.loads(raw_output)
-        if isinstance(parsed, list):
-            parsed = {"action": "use_tool", "tools": parsed}
-    except json.JSONDecodeError:
-        parsed = {"action": "use_tool", "tools": []}
-
-    if "action" not in parsed:
-        parsed["action"] = "use_tool"
-    if "tools" not in parsed:
-        parsed["tools"] = []
-
-    return MultiToolCall(**parsed)
+        tools_used = chat_json(MultiToolCall, messages=[{"role": "user", "content": prompt}],
+                               normalize=_normalize_tool_plan, task="select_tools")
+    except ValueError as e:
+        log_status("PLANNER", f"Unable to parse tool plan: {e}")
+        tools_used = MultiToolCall(action="use_tool", tools=[])
+    tools_used.route = "llm"
+    return tools_used
+
+def _normalize_tool_plan(parsed: Any) -> Any:
+    if isinstance(parsed, list):
+        parsed = {"tools": parsed}
+    if isinstance(parsed, dict):
+        parsed.setdefault("action", "use_tool")
+        parsed.setdefault("tools", [])
+    return parsed
 
 # ----------------------------
-# Generate final answer
+# Tool runners
 # ----------------------------
-def generate_answer(question: str, tools_used: MultiToolCall, data: Optional[pd.DataFrame] = None) -> DirectAnswer:
+TOOL_TIMEOUT_SECONDS = 180
+MAX_TOOL_WORKERS = 4
+
+def _tool_failure(reason: str) -> dict:
+    return {"answer": None, "reasoning": reason, "confidence": 0.0}
+
+def _run_tool(question: str, tool: ToolCall, data: Optional["pd.DataFrame"], parallel: bool) -> dict:
+    with span(f"tool.{tool.tool}", "tool"):
+        # The tool's module is imported here on first use, on the tool's own worker thread
+        runner = get_runner(tool.tool)
+        return runner(question, tool, data, parallel=parallel)
+
+def run_tools(question: str, tools_used: MultiToolCall, data: Optional["pd.DataFrame"] = None,
+              parallel: bool = True, timeout: float = TOOL_TIMEOUT_SECONDS) -> dict:
+    """
+    Run every selected tool and return their outputs keyed by tool name.
+    In parallel mode the tools run on a bounded thread pool, each with its own timeout;
+    outputs are always merged in the order the planner listed the tools. A tool that times
+    out has its queued and running LLM requests cancelled.
+    """
     agent_outputs = {}
 
-    for tool in tools_used.tools:
-        if tool.tool == "csv":
-            res = analyze_csv(df=data)
-            agent_outputs["csv"] = res.dict()
-            print("[DEBUG] [40% COMPLETED] CSV analysis complete")
-
-        elif tool.tool == "api_call":
-            tickers = extract_tickers(tool.details or question)
-            print("[DEBUG] [45% COMPLETED] ticker(s) extracted", tickers)
-            api_results = {}
-            for ticker in tickers:
-                count = 1
-                res = fetch_stock_data(ticker)
-                print(f"[DEBUG] [50% COMPLETED] API call complete for ticker {count}: ", ticker)
-                if res.answer:
-                    formatted = (
-                        f"Symbol: {res.answer.get('symbol')}\n"
-                        f"Last Price: {res.answer.get('lastPrice')}\n"
-                        f"Market Cap: {res.answer.get('marketCap')}\n"
-                        f"52-Week High: {res.answer.get('yearHigh')}\n"
-                        f"52-Week Low: {res.answer.get('yearLow')}\n"
-                        f"Shares Outstanding: {res.answer.get('sharesOutstanding')}"
-                    )
-                    api_results[ticker] = {"raw": res.dict(), "formatted": formatted}
-                    print("Stock data found for: ", ticker)
-                else:
-                    api_results[ticker] = res.dict()
-                    print("Stock data not found for:", ticker)
-                count += 1
-
-            agent_outputs["api_call"] = api_results
-
-        elif tool.tool == "web_scrape":
-            res = web_scrape(query=question)
-            agent_outputs["web_scrape"] = res.dict()
-            print("[DEBUG] [50% COMPLETED] web scraping complete")
-
-        else:
-            agent_outputs[tool.tool] = {"answer": None, "reasoning": "Tool not implemented", "confidence": 0.0}
-
-    save_context(question, agent_outputs)
-    context_text = get_context_text()
-
-    print("[DEBUG] [55% COMPLETED] web scraping complete")
-
-    planner_prompt = f"""
-You are a reasoning agent.
-
-Context:
-{context_text}
-
-Question: {question}
-
-Tool outputs:
-{json.dumps(agent_outputs, indent=2)}
+    if not parallel:
+        for tool in tools_used.tools:
+            if get_tool(tool.tool) is None:
+                agent_outputs[tool.tool] = _tool_failure("Tool not implemented")
+                continue
+            try:
+                agent_outputs[tool.tool] = _run_tool(question, tool, data, False)
+            except LLMCancelled:
+                raise  # serial tools share the request's scope: the whole request was cancelled
+            except Exception as e:
+                log_status("TOOLS", f"Tool '{tool.tool}' failed: {e}")
+                agent_outputs[tool.tool] = _tool_failure(f"Tool '{tool.tool}' failed: {e}")
+        return agent_outputs
+
+    pool = ThreadPoolExecutor(max_workers=MAX_TOOL_WORKERS)
+    futures = {}
+    scopes = {}
+    try:
+        for tool in tools_used.tools:
+            if get_tool(tool.tool) is not None and tool.tool not in futures:
+                scopes[tool.tool] = CancelScope(f"tool '{tool.tool}'")
+                futures[tool.tool] = pool.submit(bind(run_cancellable), scopes[tool.tool], _run_tool,
+                                                 question, tool, data, True)
+        deadline = time.monotonic() + timeout
+
+        for tool in tools_used.tools:
+            future = futures.get(tool.tool)
+            if future is None:
+                agent_outputs[tool.tool] = _tool_failure("Tool not implemented")
+                continue
+            try:
+                agent_outputs[tool.tool] = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                future.cancel()
+                scopes[tool.tool].cancel(f"timed out after {timeout}s")
+                log_status("TOOLS", f"Tool '{tool.tool}' timed out after {timeout}s")
+                agent_outputs[tool.tool] = _tool_failure(f"Tool '{tool.tool}' timed out after {timeout}s")
+            except Exception as e:
+                log_status("TOOLS", f"Tool '{tool.tool}' failed: {e}")
+                agent_outputs[tool.tool] = _tool_failure(f"Tool '{tool.tool}' failed: {e}")
+    finally:
+        # Don't block on tools that overran their timeout, or let their LLM calls hold slots
+        for name, future in futures.items():
+            if not future.done():
+                scopes[name].cancel("result no longer needed")
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    return agent_outputs
 
-Instructions:
+# ----------------------------
+# Generate final answer
+# ----------------------------
+ANSWER_INSTRUCTIONS = """Instructions:
 - Include all stock metrics (symbol, lastPrice, marketCap, yearHigh, yearLow, sharesOutstanding) in your final answer.
 - Include revenue data from CSV if available.
 - Include insights from web scraping if available.
 - Provide a combined summary that mentions trends, stock data, and research insights.
-- Return JSON with keys: answer, reasoning, confidence
-"""
+- Return JSON with keys: answer, reasoning, confidence"""
+
+# When the prompt is over budget, lower priorities are cut first
+TOOL_PROMPT_PRIORITY = {"api_call": 4, "csv": 3, "web_scrape": 2}
+DEFAULT_TOOL_PROMPT_PRIORITY = 2
+CONTEXT_PROMPT_PRIORITY = 1
+
+def render_tool_output(tool: str, output: Any) -> str:
+    """
+    Compact JSON for one tool's output, one line per ticker or search result, so that
+    truncation drops whole trailing items rather than cutting through one.
+    """
+    output = prune_empty(output)
+    if isinstance(output, dict) and isinstance(output.get("answer"), list):
+        rest = {k: v for k, v in output.items() if k != "answer"}
+        lines = [compact_json(rest)] + [compact_json(item) for item in output["answer"]]
+    elif isinstance(output, dict) and "answer" not in output:
+        lines = [compact_json({key: value}) for key, value in output.items()]
+    else:
+        lines = [compact_json(output)]
+    return f"[{tool}]\n" + "\n".join(lines)
+
+def build_answer_prompt(question: str, agent_outputs: dict, context_text: str) -> str:
+    builder = PromptBuilder(get_model_config("final_answer").prompt_budget())
+    builder.add("You are a reasoning agent.")
+    if context_text and context_text != "No previous context.":
+        builder.add(f"Context:\n{context_text}", priority=CONTEXT_PROMPT_PRIORITY, name="context")
+    builder.add(f"Question: {question}")
+    builder.add("Tool outputs:")
+    for tool, output in agent_outputs.items():
+        builder.add(render_tool_output(tool, output),
+                    priority=TOOL_PROMPT_PRIORITY.get(tool, DEFAULT_TOOL_PROMPT_PRIORITY), name=tool)
+    builder.add(ANSWER_INSTRUCTIONS)
+    prompt = builder.build()
+    current_span().set(**{f"prompt_{k}": v for k, v in builder.stats.items()})
+    if builder.stats["truncated"] or builder.stats["dropped"]:
+        log_status("55% COMPLETED", f"Prompt fitted to {builder.budget_tokens} tokens: "
+                                    f"truncated {builder.stats['truncated']}, dropped {builder.stats['dropped']}")
+    return prompt
+
+def generate_answer(question: str, tools_used: MultiToolCall, data: Optional["pd.DataFrame"] = None,
+                    parallel: bool = True, tool_timeout: float = TOOL_TIMEOUT_SECONDS,
+                    on_answer_chunk: Optional[Callable[[str], None]] = None) -> DirectAnswer:
+    """
+    Run the selected tools and synthesise the final answer.
+    With on_answer_chunk, the completion is streamed and the callback receives the
+    "answer" text as it is generated; reasoning/confidence are validated at the end.
+    """
+    agent_outputs = run_tools(question, tools_used, data, parallel=parallel, timeout=tool_timeout)
+
+    # Read prior context before saving this turn, so its outputs aren't in the prompt twice
+    context_text = get_context_text(question)
+    save_context(question, agent_outputs)
 
-    print("[DEBUG] [Attempting to generate final answer]")
+    log_status("55% COMPLETED", f"Tool outputs collected: {list(agent_outputs)}")
 
-    response = ollama.chat(model="gemma3:4b", messages=[{"role": "user", "content": planner_prompt}])
-    raw_output = clean_llm_json(response["message"]["content"].strip())
+    planner_prompt = build_answer_prompt(question, agent_outputs, context_text)
 
-    print("[DEBUG] [Successfully generated final answer]")
+    log_status("60% COMPLETED", "Generating final answer")
 
-    try:
-        parsed = json.loads(raw_output)
-    except json.JSONDecodeError:
-        parsed = {"answer": "Unable to generate final answer", "reasoning": "Parsing error", "confidence": 0.0}
+    messages = [{"role": "user", "content": planner_prompt}]
+    streamed_answer = ""
+    if on_answer_chunk is None:
+        response = cached_chat(messages=messages, task="final_answer")
+        content = response["message"]["content"]
+    else:
+        parser = StreamingFieldParser("answer")
+        for piece in stream_chat(messages=messages, task="final_answer"):
+            delta = parser.feed(piece)
+            if delta:
+                on_answer_chunk(delta)
+        content = parser.text
+        streamed_answer = parser.value
 
-    return DirectAnswer(**parsed)
+    try:
+        if streamed_answer:
+            # The user has already seen this answer, so only the JSON envelope can be recovered
+            answer = parse_into(DirectAnswer, content)
+        else:
+            answer = chat_json(DirectAnswer, messages=messages, content=content, task="final_answer")
+        log_status("85% COMPLETED", "Final answer parsed")
+        return answer
+    except (ValueError, TypeError, ValidationError):
+        log_status("85% COMPLETED", "Final answer could not be parsed")
+        return DirectAnswer(
+            answer=streamed_answer or "Unable to generate final answer",
+            reasoning="Parsing error",
+            confidence=0.0
+        )
 
 # ----------------------------
 # CLI Example
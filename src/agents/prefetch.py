@@ -0,0 +1,83 @@
+# prefetch.py
+
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, List, Optional
+from agents.planner_agent import ROUTER_CONFIDENCE_THRESHOLD, MultiToolCall, likely_tools, route_tools
+from agents.tool_registry import get_prefetcher
+from helpers.llm_scheduler import CancelScope, LLMCancelled, run_cancellable
+from helpers.tracing import bind, log_status, span
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Start the I/O of likely tools (searches, page downloads, quotes, the CSV profile) while
+# the LLM planner decides. Needs a request_memo() around the request to hand results over.
+SPECULATIVE_PREFETCH = os.getenv("SPECULATIVE_PREFETCH", "1") != "0"
+
+def _prefetch_tool(name: str, question: str, data: Optional["pd.DataFrame"]):
+    with span(f"prefetch.{name}", "tool") as s:
+        try:
+            prefetcher = get_prefetcher(name)
+            if prefetcher is not None:
+                prefetcher(question, data)
+        except LLMCancelled:
+            s.set(cancelled=True)
+        except Exception as e:
+            # Speculative: the tool itself reports the error if it is planned
+            s.set(error=str(e)[:200])
+
+class Prefetch:
+    """
+    Speculative prefetches for one request, one cancel scope per tool. Prefetchers only do
+    I/O, so they never compete with the planner for an LLM slot; their results land in the
+    request's single-flight memo, where the planned tools pick them up (or join them in flight).
+    """
+
+    def __init__(self, question: str, data: Optional["pd.DataFrame"], tools: List[str]):
+        self.started = time.monotonic()
+        self.tools = tools
+        self._scopes: Dict[str, CancelScope] = {}
+        self._futures: Dict[str, Future] = {}
+        self._pool = ThreadPoolExecutor(max_workers=max(1, len(tools)))
+        for name in tools:
+            self._scopes[name] = CancelScope(f"prefetch '{name}'")
+            self._futures[name] = self._pool.submit(bind(run_cancellable), self._scopes[name],
+                                                    _prefetch_tool, name, question, data)
+
+    def settle(self, tools_used: MultiToolCall) -> Dict[str, List[str]]:
+        """Keep the prefetches the plan uses and cancel the rest. Returns {"used": [...], "wasted": [...]}."""
+        planned = {tool.tool for tool in tools_used.tools}
+        used = [name for name in self.tools if name in planned]
+        wasted = [name for name in self.tools if name not in planned]
+        for name in wasted:
+            self._futures[name].cancel()
+            self._scopes[name].cancel("not in the plan")
+        # Kept prefetches finish on their own; the tools wait for them through the single-flights
+        self._pool.shutdown(wait=False)
+        log_status("PREFETCH", f"Used {used}, discarded {wasted} "
+                               f"({time.monotonic() - self.started:.2f}s after start)")
+        return {"used": used, "wasted": wasted}
+
+    def cancel(self):
+        for name in self.tools:
+            self._futures[name].cancel()
+            self._scopes[name].cancel("request finished")
+        self._pool.shutdown(wait=False)
+
+def start_prefetch(question: str, data: Optional["pd.DataFrame"] = None,
+                   enabled: Optional[bool] = None) -> Optional[Prefetch]:
+    """
+    Prefetch for the tools the rules select or suggest, but only when the rule router is
+    not confident on its own, i.e. when select_tools() will wait on the LLM planner.
+    """
+    if not (SPECULATIVE_PREFETCH if enabled is None else enabled):
+        return None
+    if route_tools(question, data).route_confidence >= ROUTER_CONFIDENCE_THRESHOLD:
+        return None
+    tools = likely_tools(question, data)
+    if not tools:
+        return None
+    log_status("PREFETCH", f"Prefetching for {tools} while the planner decides")
+    return Prefetch(question, data, tools)
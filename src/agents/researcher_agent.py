@@ -1,11 +1,21 @@
+import codecs
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pydantic import BaseModel
-from typing import Any
+from typing import Any, Dict, Iterator, List, Optional
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
 from serpapi import GoogleSearch
-import ollama
 from helpers.llm_utils import clean_llm_json
+from helpers.llm_client import cached_chat, chat_json
+from helpers.model_config import get_model_config
+from helpers.prompt_builder import count_tokens, truncate_to_tokens
+from helpers.html_text import ParagraphExtractor
+from helpers.singleflight import SingleFlight
+from helpers.web_cache import WEB_CACHE_ENABLED, get_web_cache, normalize_query
+from helpers.tracing import bind, log_status, span
+from helpers.llm_scheduler import raise_if_cancelled
 from dotenv import load_dotenv
 import os
 
@@ -13,26 +23,119 @@ load_dotenv()
 
 SERPAPI_KEY = os.getenv("SERPAPI_KEY")
 
+MAX_RESULTS = 3
+MAX_SCRAPE_WORKERS = 4
+MAX_PAGE_CHARS = 5000  # paragraph text passed on to the summariser
+MAX_PAGE_BYTES = int(os.getenv("MAX_PAGE_BYTES", str(2 * 1024 * 1024)))  # stop downloading after this
+PAGE_CHUNK_BYTES = 16 * 1024
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+SUMMARY_FAILED = "Unable to summarise content."
+# Summarise the pages of a search in as few LLM requests as fit, instead of one per page
+BATCH_SUMMARIES = os.getenv("BATCH_SUMMARIES", "1") != "0"
+MAX_BATCH_PAGES = int(os.getenv("MAX_BATCH_PAGES", "4"))
+SUMMARY_TOKENS = 160  # reply room per page, as summarize_page's num_predict
+MIN_BATCH_PAGE_TOKENS = 500  # pages share a batch prompt, but never get less text than this
+
+_scrape_flight = SingleFlight("web_scrape")
+# Searches and page fetches of one request are shared with a speculative prefetch of them
+_search_flight = SingleFlight("web_search")
+_page_flight = SingleFlight("web_page")
+
 class DirectAnswer(BaseModel):
     answer: Any
     reasoning: str
     confidence: float
 
-def scrape_page(url: str) -> str:
-    """Scrape the main text from a web page using requests + BeautifulSoup"""
-    try:
-        headers = {"User-Agent": "Mozilla/5.0"}
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, "html.parser")
-        paragraphs = soup.find_all("p")
-        text = "\n".join(p.get_text() for p in paragraphs)
-        return text[:5000]  # limit to 5000 chars for LLM
-    except Exception as e:
-        return f"ERROR: {e}"
+class BatchSummaries(BaseModel):
+    summaries: Dict[str, str]
+
+# ----------------------------
+# Shared HTTP session
+# ----------------------------
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+def get_http_session() -> requests.Session:
+    """Return a process-wide session so page fetches reuse pooled keep-alive connections"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=MAX_SCRAPE_WORKERS * 2, pool_maxsize=MAX_SCRAPE_WORKERS * 2)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update({"User-Agent": "Mozilla/5.0"})
+            _session = session
+        return _session
+
+def fetch_page(url: str, streaming: bool = True, etag: Optional[str] = None,
+               last_modified: Optional[str] = None) -> dict:
+    """
+    Download a page and extract its paragraph text. By default the response is streamed and
+    parsed incrementally, and the download stops once MAX_PAGE_CHARS of text are collected
+    or MAX_PAGE_BYTES have been read; streaming=False parses the whole page with BeautifulSoup.
+    With validators from an earlier fetch the GET is conditional, and an unchanged page
+    comes back as status 304 with no text.
+    """
+    page = {"status": None, "text": "", "etag": None, "last_modified": None, "error": None}
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    with span("http.get", "http", url=url, streaming=streaming, conditional=bool(headers)) as s:
+        try:
+            with get_http_session().get(url, timeout=10, stream=True, headers=headers) as response:
+                page["status"] = response.status_code
+                s.set(status=response.status_code)
+                if response.status_code == 304:
+                    return page
+                response.raise_for_status()
+                page["etag"] = response.headers.get("ETag")
+                page["last_modified"] = response.headers.get("Last-Modified")
+                content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+                if content_type and content_type not in HTML_CONTENT_TYPES:
+                    s.set(skipped=content_type)
+                    page["error"] = f"Unsupported content type {content_type}"
+                    return page
+                if streaming:
+                    page["text"] = _stream_paragraphs(response, s)
+                    return page
+
+                s.set(bytes=len(response.content))
+                from bs4 import BeautifulSoup  # only the non-streaming path needs it
+                soup = BeautifulSoup(response.text, "html.parser")
+                paragraphs = soup.find_all("p")
+                text = "\n".join(p.get_text() for p in paragraphs)
+                page["text"] = text[:MAX_PAGE_CHARS]  # limit to 5000 chars for LLM
+                return page
+        except Exception as e:
+            s.set(error=str(e))
+            page["error"] = str(e)
+            return page
+
+def scrape_page(url: str, streaming: bool = True) -> str:
+    """Scrape the main text from a web page; failures come back as "ERROR: ..." text"""
+    page = fetch_page(url, streaming=streaming)
+    return f"ERROR: {page['error']}" if page["error"] else page["text"]
+
+def _stream_paragraphs(response: requests.Response, s: Any) -> str:
+    # Without a declared charset requests assumes ISO-8859-1 for text/*; UTF-8 is the better guess
+    encoding = response.encoding if "charset" in response.headers.get("Content-Type", "").lower() else "utf-8"
+    decoder = codecs.getincrementaldecoder(encoding or "utf-8")(errors="replace")
+    extractor = ParagraphExtractor(MAX_PAGE_CHARS)
+    read = 0
+    for chunk in response.iter_content(chunk_size=PAGE_CHUNK_BYTES):
+        read += len(chunk)
+        extractor.feed(decoder.decode(chunk))
+        if extractor.done or read >= MAX_PAGE_BYTES:
+            break
+    s.set(bytes=read, truncated=extractor.done or read >= MAX_PAGE_BYTES)
+    return extractor.text()
 
 def summarize_content(title: str, url: str, content: str) -> str:
-    """Summarise scraped content using gemma3:4b LLM"""
+    """Summarise scraped content using the summarize_page model"""
     prompt = f"""
 You are an expert summarizer. Summarise the following web page content in 2-3 concise sentences:
 
@@ -43,53 +146,253 @@ Content: {content}
 Return strictly plain text summary.
 """
     try:
-        response = ollama.chat(
-            model="gemma3:4b",
-            messages=[{"role": "user", "content": prompt}]
+        response = cached_chat(
+            messages=[{"role": "user", "content": prompt}],
+            task="summarize_page"
         )
         summary = response["message"]["content"].strip()
         return summary
     except Exception:
-        return "Unable to summarise content."
+        return SUMMARY_FAILED
+
+def search_results(query: str, num_results: int = MAX_RESULTS, use_cache: bool = True) -> list:
+    """Fetch the top organic Google results for a query from SerpAPI (cached for SEARCH_TTL_SECONDS)"""
+    if not use_cache:
+        return _search_results(query, num_results, use_cache)
+    key = (normalize_query(query), num_results)
+    return list(_search_flight.do(key, _search_results, query, num_results, use_cache))
+
+def _search_results(query: str, num_results: int, use_cache: bool) -> list:
+    use_cache = use_cache and WEB_CACHE_ENABLED
+    if use_cache:
+        cached = get_web_cache().get_search(query, num_results)
+        if cached is not None:
+            return cached
 
-def web_scrape(query: str) -> DirectAnswer:
-    """Fetch top 3 Google results, scrape, and summarise each page"""
-    # Step 1: Fetch top 3 results from SerpAPI
     params = {
         "engine": "google",
         "q": query,
         "api_key": SERPAPI_KEY,
-        "num": 3
+        "num": num_results
     }
-    search = GoogleSearch(params)
-    results = search.get_dict()
-    organic_results = results.get("organic_results", [])[:3]
+    with span("serpapi.search", "http", query=query, num_results=num_results) as s:
+        search = GoogleSearch(params)
+        results = search.get_dict()
+        organic = results.get("organic_results", [])[:num_results]
+        s.set(results=len(organic))
+    if use_cache and organic:
+        get_web_cache().put_search(query, num_results, organic)
+    return organic
+
+def fetch_for_summary(rank: int, res: dict, use_cache: bool = True) -> dict:
+    """
+    Scrape one search result. A cached page is reused as is while fresh, and otherwise
+    revalidated; if unchanged, so is its summary. Returns the result with "content" set to
+    a reusable summary, or with the page text under "text" when it still needs summarising.
+    """
+    if not use_cache:
+        return _fetch_for_summary(rank, res, use_cache)
+    # A copy: callers fill in the summary on the result they get
+    return dict(_page_flight.do((rank, res.get("link")), _fetch_for_summary, rank, res, use_cache))
+
+def _fetch_for_summary(rank: int, res: dict, use_cache: bool) -> dict:
+    url = res.get("link")
+    title = res.get("title")
+    snippet = res.get("snippet")
+    result = {"rank": rank, "title": title, "url": url, "snippet": snippet, "content": "", "error": None}
+
+    cache = get_web_cache() if use_cache and WEB_CACHE_ENABLED and url else None
+    cached = cache.get_page(url) if cache else None
+    if cached and cached["summary"] and cache.is_fresh(cached):
+        result["content"] = cached["summary"]
+        return result
+
+    page = fetch_page(url, etag=cached and cached["etag"], last_modified=cached and cached["last_modified"])
+    if page["status"] == 304 and cached:
+        cache.touch_page(url)
+        text, summary = cached["text"], cached["summary"]
+    elif page["error"]:
+        result["error"] = f"ERROR: {page['error']}"
+        return result
+    else:
+        text, summary = page["text"], None
+        if cache:
+            cache.put_page(url, text, etag=page["etag"], last_modified=page["last_modified"])
+
+    if summary:
+        result["content"] = summary
+    else:
+        result["text"] = text
+    return result
+
+def _set_summary(result: dict, summary: str, use_cache: bool = True) -> dict:
+    result.pop("text", None)
+    result["content"] = summary
+    if use_cache and WEB_CACHE_ENABLED and result["url"] and summary != SUMMARY_FAILED:
+        get_web_cache().put_summary(result["url"], summary)
+    return result
+
+def scrape_and_summarize(rank: int, res: dict, use_cache: bool = True) -> dict:
+    """Scrape one search result and summarise it as soon as the page arrives."""
+    result = fetch_for_summary(rank, res, use_cache)
+    if "text" in result:
+        _set_summary(result, summarize_content(result["title"], result["url"], result["text"]), use_cache)
+    return result
+
+# ----------------------------
+# Batched summaries
+# ----------------------------
+BATCH_SUMMARY_PROMPT = """
+You are an expert summarizer. Summarise each of the web pages below in 2-3 concise sentences.
+
+{pages}
+
+Return JSON only, mapping each page id to its summary:
+{{"summaries": {{{example}}}}}
+"""
+
+def _batch_capacity() -> int:
+    """Pages per batch: as many as fit the summarize_page context with their reply room."""
+    num_ctx = get_model_config("summarize_page").options.get("num_ctx", 4096)
+    overhead = count_tokens(BATCH_SUMMARY_PROMPT) + 50
+    return max(1, min(MAX_BATCH_PAGES, (num_ctx - overhead) // (MIN_BATCH_PAGE_TOKENS + SUMMARY_TOKENS)))
+
+def plan_batches(pages: List[dict]) -> List[List[dict]]:
+    """Split pages into the fewest batches that fit, with their sizes as even as possible."""
+    if not pages:
+        return []
+    count = -(-len(pages) // _batch_capacity())
+    size = -(-len(pages) // count)
+    return [pages[i:i + size] for i in range(0, len(pages), size)]
 
+def _share_budget(lengths: List[int], budget: int) -> List[int]:
+    """Split a token budget between texts: short ones keep their length, long ones share the rest."""
+    shares = [0] * len(lengths)
+    left = budget
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    for n, i in enumerate(order):
+        shares[i] = min(lengths[i], left // (len(order) - n))
+        left -= shares[i]
+    return shares
+
+def _normalize_batch(parsed: Any) -> Any:
+    # Accept a bare {id: summary} map or a list of {"id", "summary"} items as well
+    if isinstance(parsed, list):
+        parsed = {str(item.get("id")): item.get("summary") for item in parsed if isinstance(item, dict)}
+    if isinstance(parsed, dict) and not isinstance(parsed.get("summaries"), dict):
+        parsed = {"summaries": parsed}
+    if isinstance(parsed, dict):
+        parsed["summaries"] = {str(k).strip(): str(v).strip() for k, v in parsed["summaries"].items()
+                               if isinstance(v, (str, int, float)) and str(v).strip()}
+    return parsed
+
+def summarize_pages(pages: List[dict]) -> Dict[int, str]:
+    """
+    Summarise several pages (results with "rank", "title", "url" and "text") in one request
+    that returns a JSON map of page id -> summary. Pages missing from the reply, or all of
+    them if it can't be parsed, fall back to one summarize_content call each.
+    """
+    if len(pages) == 1:
+        page = pages[0]
+        return {page["rank"]: summarize_content(page["title"], page["url"], page["text"])}
+
+    config = get_model_config("summarize_page")
+    reply_tokens = SUMMARY_TOKENS * len(pages)
+    budget = (config.options.get("num_ctx", 4096) - reply_tokens - count_tokens(BATCH_SUMMARY_PROMPT)
+              - 50 * len(pages))
+    shares = _share_budget([count_tokens(page["text"]) for page in pages], budget)
+    blocks = "\n\n".join(
+        f'<page id="{page["rank"]}">\nTitle: {page["title"]}\nURL: {page["url"]}\n'
+        f'Content: {truncate_to_tokens(page["text"], share)}\n</page>'
+        for page, share in zip(pages, shares)
+    )
+    example = ", ".join(f'"{page["rank"]}": "<summary>"' for page in pages)
+    prompt = BATCH_SUMMARY_PROMPT.format(pages=blocks, example=example)
+
+    summaries: Dict[int, str] = {}
+    with span("summarize.batch", "llm", pages=len(pages)) as s:
+        try:
+            parsed = chat_json(BatchSummaries, messages=[{"role": "user", "content": prompt}],
+                               options={"num_predict": reply_tokens}, normalize=_normalize_batch,
+                               task="summarize_page")
+            ranks = {str(page["rank"]): page["rank"] for page in pages}
+            summaries = {ranks[k]: v for k, v in parsed.summaries.items() if k in ranks}
+        except Exception as e:
+            s.set(error=str(e)[:200])
+        missing = [page for page in pages if page["rank"] not in summaries]
+        s.set(missing=len(missing))
+
+    for page in missing:
+        summaries[page["rank"]] = summarize_content(page["title"], page["url"], page["text"])
+    return summaries
+
+def _iter_batched(organic_results: List[dict], max_workers: int) -> Iterator[dict]:
+    """Fetch every page first, then summarise those without a reusable summary in batches."""
+    if max_workers <= 1:
+        results = [fetch_for_summary(rank, res) for rank, res in enumerate(organic_results, 1)]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(organic_results))) as pool:
+            futures = [pool.submit(bind(fetch_for_summary), rank, res) for rank, res in enumerate(organic_results, 1)]
+            results = [future.result() for future in futures]
+
+    pending = []
+    for result in results:
+        if "text" in result:
+            pending.append(result)
+        else:
+            yield result
+
+    for batch in plan_batches(pending):
+        summaries = summarize_pages(batch)
+        for result in batch:
+            yield _set_summary(result, summaries.get(result["rank"]) or SUMMARY_FAILED)
+
+def iter_web_scrape(query: str, num_results: int = MAX_RESULTS,
+                    max_workers: int = MAX_SCRAPE_WORKERS, batch: bool = BATCH_SUMMARIES) -> Iterator[dict]:
+    """
+    Pipelined search -> scrape -> summarise. Up to max_workers pages are fetched at once
+    over the shared session and results are yielded in completion order (each carries its
+    search "rank"). With batch, the pages are summarised together in as few requests as
+    fit; otherwise each page is summarised on its own as soon as it is downloaded.
+    """
+    organic_results = search_results(query, num_results)
     if not organic_results:
+        return
+
+    if batch:
+        yield from _iter_batched(organic_results, max_workers)
+        return
+
+    if max_workers <= 1:
+        for rank, res in enumerate(organic_results, 1):
+            yield scrape_and_summarize(rank, res)
+        return
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(organic_results))) as pool:
+        futures = [pool.submit(bind(scrape_and_summarize), rank, res) for rank, res in enumerate(organic_results, 1)]
+        for future in as_completed(futures):
+            yield future.result()
+
+def web_scrape(query: str, num_results: int = MAX_RESULTS,
+               max_workers: int = MAX_SCRAPE_WORKERS) -> DirectAnswer:
+    """Fetch the top Google results, then scrape and summarise each page concurrently"""
+    # Identical concurrent queries (e.g. within a batch run) share one search-and-scrape
+    key = (normalize_query(query), num_results)
+    return _scrape_flight.do(key, _web_scrape, query, num_results, max_workers)
+
+def _web_scrape(query: str, num_results: int, max_workers: int) -> DirectAnswer:
+    scraped_results = sorted(
+        iter_web_scrape(query, num_results=num_results, max_workers=max_workers),
+        key=lambda r: r["rank"]
+    )
+
+    if not scraped_results:
         return DirectAnswer(
             answer=[],
             reasoning=f"No results found for '{query}'",
             confidence=0.0
         )
 
-    # Step 2: Scrape and summarise each page
-    scraped_results = []
-    for res in organic_results:
-        url = res.get("link")
-        title = res.get("title")
-        snippet = res.get("snippet")
-
-        content = scrape_page(url)
-        summary = summarize_content(title, url, content) if not content.startswith("ERROR") else ""
-
-        scraped_results.append({
-            "title": title,
-            "url": url,
-            "snippet": snippet,
-            "content": summary,
-            "error": content if content.startswith("ERROR") else None
-        })
-
     reasoning = f"Fetched, scraped, and summarised top {len(scraped_results)} Google search results for '{query}'."
     confidence = 0.9
 
@@ -99,6 +402,30 @@ def web_scrape(query: str) -> DirectAnswer:
         confidence=confidence
     )
 
+def _prefetch_page(rank: int, res: dict):
+    raise_if_cancelled()
+    fetch_for_summary(rank, res)
+
+def prefetch_web_scrape_tool(question: str, data: Optional[Any] = None):
+    """
+    Speculative part of "web_scrape": the search and page downloads, without summarising.
+    The tool picks them up from the request memo (or joins them in flight) if it runs.
+    """
+    organic_results = search_results(question, MAX_RESULTS)
+    raise_if_cancelled()
+    if not organic_results:
+        return
+    with ThreadPoolExecutor(max_workers=min(MAX_SCRAPE_WORKERS, len(organic_results))) as pool:
+        futures = [pool.submit(bind(_prefetch_page), rank, res) for rank, res in enumerate(organic_results, 1)]
+        for future in futures:
+            future.result()
+
+def run_web_scrape_tool(question: str, tool: Any, data: Optional[Any] = None, parallel: bool = True) -> dict:
+    """Tool runner for "web_scrape" (see agents.tool_registry)."""
+    res = web_scrape(query=question) if parallel else web_scrape(query=question, max_workers=1)
+    log_status("50% COMPLETED", "Web scraping complete")
+    return res.dict()
+
 # Example usage
 if __name__ == "__main__":
     result = web_scrape("Recent trends in the energy sector")
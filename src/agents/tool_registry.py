@@ -0,0 +1,143 @@
+# tool_registry.py
+
+import importlib
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional
+from pydantic import BaseModel
+from helpers.tracing import log_status, span
+
+class ToolSpec(BaseModel):
+    name: str
+    description: str
+    requires_csv: bool = False
+    keywords: List[str] = []       # a match is enough to select the tool
+    weak_keywords: List[str] = []  # suggestive, but not decisive on their own
+    # "module:function" taking (question, tool_call, data, parallel=...) and returning a dict.
+    # The module (and its dependencies) is only imported when the tool first runs.
+    runner: str
+    # Optional "module:function" taking (question, data) that starts the tool's I/O
+    # speculatively while the LLM planner decides (see agents.prefetch)
+    prefetch: Optional[str] = None
+
+BUILTIN_TOOLS: List[ToolSpec] = [
+    ToolSpec(
+        name="csv", description="Analyze uploaded CSV data for totals, averages, metrics.", requires_csv=True,
+        # With a CSV loaded the tool is always suggested; these make it decisive
+        keywords=["csv", "data", "dataset", "file", "spreadsheet", "sales", "revenue", "total", "average",
+                  "metric", "column"],
+        runner="agents.data_analyst_agent:run_csv_tool", prefetch="agents.data_analyst_agent:prefetch_csv_tool"
+    ),
+    ToolSpec(
+        name="web_scrape", description="Research online news or updates about a topic.", requires_csv=False,
+        keywords=["news", "research", "trend", "headline", "article", "developments"],
+        # "latest price", "recent quote": recency alone doesn't mean web research
+        weak_keywords=["latest", "recent", "update", "industry", "sector", "outlook", "happening"],
+        runner="agents.researcher_agent:run_web_scrape_tool",
+        prefetch="agents.researcher_agent:prefetch_web_scrape_tool"
+    ),
+    ToolSpec(
+        name="api_call", description="Fetch stock/market/company data from Yahoo Finance.", requires_csv=False,
+        keywords=["stock", "share price", "ticker", "market cap", "yahoo finance", "quote", "real-time"],
+        weak_keywords=["company", "companies", "competitor", "market", "financial", "benchmark", "valuation"],
+        runner="agents.information_retrieval_agent:run_api_call_tool",
+        prefetch="agents.information_retrieval_agent:prefetch_api_call_tool"
+    ),
+]
+
+# Comma-separated modules imported on first use of the registry; each calls register_tool()
+TOOL_PLUGINS = [name.strip() for name in os.getenv("TOOL_PLUGINS", "").split(",") if name.strip()]
+
+_tools: Dict[str, ToolSpec] = {}
+_runners: Dict[str, Callable[..., Any]] = {}
+_lock = threading.RLock()
+_plugins_loaded = False
+
+def register_tool(spec: ToolSpec, replace: bool = False) -> ToolSpec:
+    """Add a tool for the planner to select. Raises ValueError if the name is taken."""
+    with _lock:
+        if spec.name in _tools and not replace:
+            raise ValueError(f"Tool '{spec.name}' is already registered")
+        _tools[spec.name] = spec
+        _runners.pop(spec.name, None)
+        _runners.pop(f"{spec.name}:prefetch", None)
+    return spec
+
+def unregister_tool(name: str):
+    with _lock:
+        _tools.pop(name, None)
+        _runners.pop(name, None)
+        _runners.pop(f"{name}:prefetch", None)
+
+def _load_plugins():
+    global _plugins_loaded
+    with _lock:
+        if _plugins_loaded:
+            return
+        _plugins_loaded = True
+        for module in TOOL_PLUGINS:
+            try:
+                importlib.import_module(module)
+            except Exception as e:
+                log_status("TOOLS", f"Could not load tool plugin {module}: {e}")
+
+def tool_specs() -> List[ToolSpec]:
+    """Registered tools in registration order."""
+    _load_plugins()
+    with _lock:
+        return list(_tools.values())
+
+def get_tool(name: str) -> Optional[ToolSpec]:
+    _load_plugins()
+    with _lock:
+        return _tools.get(name)
+
+def _load(key: str, name: str, target: str) -> Callable[..., Any]:
+    runner = _runners.get(key)
+    if runner is not None:
+        return runner
+    module_name, _, attr = target.partition(":")
+    with span("tool.import", "tool", tool=name, module=module_name):
+        runner = getattr(importlib.import_module(module_name), attr)
+    with _lock:
+        _runners[key] = runner
+    return runner
+
+def get_runner(name: str) -> Callable[..., dict]:
+    """
+    The tool's runner, importing its module on first use. Raises KeyError for an unknown
+    tool and ImportError/AttributeError if the runner can't be loaded.
+    """
+    spec = get_tool(name)
+    if spec is None:
+        raise KeyError(name)
+    return _load(name, name, spec.runner)
+
+def get_prefetcher(name: str) -> Optional[Callable[..., Any]]:
+    """The tool's speculative prefetch function, or None if it has none (or isn't registered)."""
+    spec = get_tool(name)
+    if spec is None or not spec.prefetch:
+        return None
+    return _load(f"{name}:prefetch", name, spec.prefetch)
+
+def load_tools(names: Optional[List[str]] = None) -> Dict[str, Optional[str]]:
+    """
+    Import the runners of the given tools (default: all) up front, for long-running
+    processes. Returns name -> error message (None when loaded).
+    """
+    errors: Dict[str, Optional[str]] = {}
+    for name in names or [spec.name for spec in tool_specs()]:
+        try:
+            get_runner(name)
+            errors[name] = None
+        except Exception as e:
+            errors[name] = str(e)
+            log_status("TOOLS", f"Could not load tool '{name}': {e}")
+    return errors
+
+def loaded_tools() -> List[str]:
+    with _lock:
+        return [key for key in _runners if ":" not in key]
+
+for _spec in BUILTIN_TOOLS:
+    register_tool(_spec)
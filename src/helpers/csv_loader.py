@@ -0,0 +1,191 @@
+# csv_loader.py
+
+import hashlib
+import os
+import threading
+import warnings
+from collections import OrderedDict
+from typing import Any, List, Optional
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from helpers.tracing import log_status, span
+
+try:
+    import pyarrow  # noqa: F401  (Parquet engine for the on-disk cache)
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+CSV_CACHE_DIR = os.getenv("CSV_CACHE_DIR", os.path.join(".cache", "csv"))
+CHUNK_ROWS = 100_000
+# Object columns with at most this share of distinct values become categoricals
+CATEGORY_MAX_RATIO = 0.5
+MAX_FRAMES_IN_MEMORY = 4
+# String columns become datetimes when at least this share of their values parse as dates
+DATE_MIN_PARSED_RATIO = 0.9
+DATE_SAMPLE_ROWS = 200
+# Part of the cache key: bump when loading changes what the cached frame looks like
+CACHE_FORMAT_VERSION = 3
+
+_frames: "OrderedDict[str, pd.DataFrame]" = OrderedDict()
+_frames_lock = threading.Lock()
+
+# ----------------------------
+# Dtype optimisation
+# ----------------------------
+def optimize_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Downcast integers (and floats that float32 holds exactly) and turn low-cardinality strings into categoricals."""
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_integer_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            df[col] = pd.to_numeric(series, downcast="integer")
+        elif pd.api.types.is_float_dtype(series) and series.dtype != "float32":
+            # Only when lossless: float32 keeps ~7 digits, which would skew money totals and means
+            compact = series.astype("float32")
+            if np.array_equal(compact.to_numpy(dtype="float64"), series.to_numpy(dtype="float64"), equal_nan=True):
+                df[col] = compact
+        elif (not isinstance(series.dtype, pd.CategoricalDtype) and pd.api.types.is_string_dtype(series)
+              and len(series)):
+            if series.nunique(dropna=True) / len(series) <= CATEGORY_MAX_RATIO:
+                df[col] = series.astype("category")
+    return df
+
+def _parse_dates(series: pd.Series) -> pd.Series:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # "could not infer format" for non-ISO dates
+        return pd.to_datetime(series.astype(object), errors="coerce")
+
+def parse_date_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert string (or categorical) columns whose values are mostly dates to datetime64,
+    so profiles can bucket them by month or quarter instead of grouping per distinct string.
+    A sample is tried first, so text columns cost only a few hundred parse attempts.
+    """
+    for col in df.columns:
+        series = df[col]
+        if not (pd.api.types.is_string_dtype(series) or isinstance(series.dtype, pd.CategoricalDtype)):
+            continue
+        values = series.dropna()
+        if values.empty or pd.api.types.is_numeric_dtype(values.infer_objects()):
+            continue
+        sample = values.sample(min(len(values), DATE_SAMPLE_ROWS), random_state=0)
+        if _parse_dates(sample).notna().mean() < DATE_MIN_PARSED_RATIO:
+            continue
+        parsed = _parse_dates(series)
+        if parsed.notna().sum() >= DATE_MIN_PARSED_RATIO * len(values):
+            df[col] = parsed
+    return df
+
+def _concat_chunks(chunks: List[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenate optimised chunks, merging per-chunk categoricals instead of falling back to object."""
+    if len(chunks) == 1:
+        return chunks[0]
+    columns = list(chunks[0].columns)
+    cat_cols = [c for c in columns if all(isinstance(ch[c].dtype, pd.CategoricalDtype) for ch in chunks)]
+    merged = {c: union_categoricals([ch[c] for ch in chunks], ignore_order=True) for c in cat_cols}
+    frame = pd.concat([ch.drop(columns=cat_cols) for ch in chunks], ignore_index=True)
+    for c in cat_cols:
+        frame[c] = merged[c]
+    # Columns whose dtype differed between chunks come back as object/float64: optimise once more
+    return optimize_dtypes(frame[columns])
+
+def read_csv_chunked(file_path: str, chunk_rows: int = CHUNK_ROWS) -> pd.DataFrame:
+    """Read a CSV in chunks, shrinking each chunk's dtypes before the next one is read."""
+    chunks = [optimize_dtypes(chunk) for chunk in pd.read_csv(file_path, chunksize=chunk_rows)]
+    if not chunks:
+        return pd.read_csv(file_path)
+    return parse_date_columns(_concat_chunks(chunks))
+
+# ----------------------------
+# Cached loader
+# ----------------------------
+def _path_prefix(file_path: str) -> str:
+    return hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()[:16]
+
+def file_cache_key(file_path: str) -> str:
+    """
+    Key that changes whenever the file is replaced or modified. It starts with a hash of
+    the path alone, so older versions of the same file's cache can be found and removed.
+    """
+    stat = os.stat(file_path)
+    raw = f"{os.path.abspath(file_path)}|{stat.st_mtime_ns}|{stat.st_size}|v{CACHE_FORMAT_VERSION}"
+    return f"{_path_prefix(file_path)}-{hashlib.sha1(raw.encode('utf-8')).hexdigest()}"
+
+def _parquet_path(key: str) -> str:
+    return os.path.join(CSV_CACHE_DIR, f"{key}.parquet")
+
+def _remove_cache_files(keep: Optional[str] = None, prefix: str = ""):
+    """Delete cached Parquet files starting with prefix (all by default), except `keep`."""
+    try:
+        names = os.listdir(CSV_CACHE_DIR)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if name.startswith(prefix) and name.endswith(".parquet") and name != keep:
+            try:
+                os.remove(os.path.join(CSV_CACHE_DIR, name))
+            except OSError:
+                pass  # removed concurrently, or still open elsewhere
+
+def _remember(key: str, df: pd.DataFrame):
+    with _frames_lock:
+        _frames[key] = df
+        _frames.move_to_end(key)
+        while len(_frames) > MAX_FRAMES_IN_MEMORY:
+            _frames.popitem(last=False)
+
+def load_csv(file_path: str, use_cache: bool = True) -> pd.DataFrame:
+    """
+    Load a CSV with compact dtypes. Frames are kept in memory and in a Parquet cache
+    keyed by path, mtime and size, so repeat loads of an unchanged file skip parsing.
+    The returned frame is shared between callers and must not be modified in place.
+    """
+    with span("csv.load", "io", path=file_path) as s:
+        df = _load_csv(file_path, use_cache, s)
+        s.set(rows=len(df), columns=len(df.columns))
+        return df
+
+def _load_csv(file_path: str, use_cache: bool, s: Any) -> pd.DataFrame:
+    if not use_cache:
+        s.set(source="csv")
+        return read_csv_chunked(file_path)
+
+    key = file_cache_key(file_path)
+    with _frames_lock:
+        if key in _frames:
+            _frames.move_to_end(key)
+            s.set(source="memory")
+            return _frames[key]
+
+    parquet_path = _parquet_path(key)
+    if PARQUET_AVAILABLE and os.path.exists(parquet_path):
+        try:
+            df = pd.read_parquet(parquet_path)
+            _remember(key, df)
+            s.set(source="parquet")
+            return df
+        except Exception as e:
+            log_status("CSV CACHE", f"Ignoring unreadable CSV cache {parquet_path}: {e}")
+
+    s.set(source="csv")
+    df = read_csv_chunked(file_path)
+    if PARQUET_AVAILABLE:
+        try:
+            os.makedirs(CSV_CACHE_DIR, exist_ok=True)
+            tmp_path = f"{parquet_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, parquet_path)
+            # The file changed: earlier versions of its cache can never be hit again
+            _remove_cache_files(keep=os.path.basename(parquet_path), prefix=_path_prefix(file_path))
+        except Exception as e:
+            log_status("CSV CACHE", f"Could not write CSV cache {parquet_path}: {e}")
+    _remember(key, df)
+    return df
+
+def clear_csv_cache(files: bool = True):
+    """Drop the in-memory frames and, unless files=False, the Parquet cache files."""
+    with _frames_lock:
+        _frames.clear()
+    if files:
+        _remove_cache_files()
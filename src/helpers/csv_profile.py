@@ -0,0 +1,213 @@
+# csv_profile.py
+
+import re
+import threading
+import weakref
+from concurrent.futures import Future
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+# Limits that keep the profile (and the prompt built from it) a fixed size, whatever the row count
+MAX_COLUMNS = 30
+TOP_CATEGORIES = 5
+MAX_PERIODS = 12
+SAMPLE_ROWS = 10
+MAX_CELL_CHARS = 40
+
+PERIOD_COLUMN_PATTERN = re.compile(r"date|time|period|day|week|month|quarter|year", re.IGNORECASE)
+QUANTILES = [0.0, 0.25, 0.5, 0.75, 1.0]
+# Calendar buckets tried, finest first, when the period column holds timestamps
+PERIOD_FREQUENCIES = ["D", "W", "M", "Q", "Y"]
+
+def _round(value: Any) -> Any:
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else round(float(value), 4)
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+def _short(value: Any) -> str:
+    text = str(value)
+    return text if len(text) <= MAX_CELL_CHARS else text[:MAX_CELL_CHARS - 3] + "..."
+
+def find_period_column(df: pd.DataFrame) -> Optional[str]:
+    """Pick the column that orders the rows in time: a datetime column, else one named like a period."""
+    for col in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            return col
+    for col in df.columns:
+        if PERIOD_COLUMN_PATTERN.search(str(col)) and not pd.api.types.is_float_dtype(df[col]):
+            return col
+    return None
+
+def _numeric_stats(df: pd.DataFrame) -> Dict[str, dict]:
+    numeric = df.select_dtypes(include="number")
+    if numeric.empty:
+        return {}
+    totals = numeric.sum()
+    means = numeric.mean()
+    quantiles = numeric.quantile(QUANTILES)
+    nulls = numeric.isna().sum()
+    return {
+        col: {
+            "total": _round(totals[col]),
+            "mean": _round(means[col]),
+            "min": _round(quantiles.at[0.0, col]),
+            "p25": _round(quantiles.at[0.25, col]),
+            "median": _round(quantiles.at[0.5, col]),
+            "p75": _round(quantiles.at[0.75, col]),
+            "max": _round(quantiles.at[1.0, col]),
+            "nulls": int(nulls[col]),
+        }
+        for col in numeric.columns
+    }
+
+def _category_stats(df: pd.DataFrame, exclude: Optional[str] = None) -> Dict[str, dict]:
+    stats = {}
+    for col in df.columns:
+        if col == exclude or pd.api.types.is_numeric_dtype(df[col]) or pd.api.types.is_datetime64_any_dtype(df[col]):
+            continue
+        counts = df[col].value_counts(dropna=True)
+        stats[col] = {
+            "unique": int(counts.size),
+            "top": [[_short(k), int(v)] for k, v in counts.head(TOP_CATEGORIES).items()],
+            "nulls": int(df[col].isna().sum()),
+        }
+    return stats
+
+def _period_growth(df: pd.DataFrame, period_col: str) -> Optional[dict]:
+    """Totals per period for every numeric column, with period-over-period growth in percent."""
+    numeric_cols = [c for c in df.select_dtypes(include="number").columns if c != period_col]
+    if not numeric_cols:
+        return None
+    keys = df[period_col]
+    is_datetime = pd.api.types.is_datetime64_any_dtype(keys)
+    if is_datetime:
+        # Bucket timestamps into the finest calendar period that keeps the table short
+        span_days = (keys.max() - keys.min()).days
+        approx_days = {"D": 1, "W": 7, "M": 30, "Q": 91, "Y": 365}
+        freq = next((f for f in PERIOD_FREQUENCIES if span_days / approx_days[f] <= MAX_PERIODS * 4), "Y")
+        keys = keys.dt.to_period(freq)
+    totals = df.groupby(keys, sort=is_datetime, observed=True)[numeric_cols].sum()
+    growth = totals.pct_change().mul(100).replace([np.inf, -np.inf], np.nan)
+    overall = (totals.iloc[-1] / totals.iloc[0] - 1).mul(100) if len(totals) > 1 else None
+
+    periods = len(totals)
+    totals, growth = totals.tail(MAX_PERIODS), growth.tail(MAX_PERIODS)
+    return {
+        "period_column": period_col,
+        "periods": periods,
+        "rows": [
+            {
+                "period": _short(period),
+                **{col: _round(totals.at[period, col]) for col in numeric_cols},
+                **{f"{col}_growth_pct": _round(growth.at[period, col]) for col in numeric_cols},
+            }
+            for period in totals.index
+        ],
+        "first_to_last_growth_pct": {col: _round(overall[col]) for col in numeric_cols} if overall is not None else {},
+    }
+
+def _stratified_sample(df: pd.DataFrame, strata: Optional[str]) -> pd.DataFrame:
+    """A few representative rows: spread across the top category if there is one, else evenly through the file."""
+    if len(df) <= SAMPLE_ROWS:
+        return df
+    if strata is not None:
+        per_group = max(1, SAMPLE_ROWS // max(1, df[strata].nunique()))
+        shuffled = df.sample(n=min(len(df), SAMPLE_ROWS * 100), random_state=0)
+        sample = shuffled.groupby(strata, sort=False, observed=True).head(per_group)
+        if len(sample) >= 2:
+            return sample.head(SAMPLE_ROWS).sort_index()
+    positions = np.unique(np.linspace(0, len(df) - 1, SAMPLE_ROWS).astype(int))
+    return df.iloc[positions]
+
+def profile_dataframe(df: pd.DataFrame) -> dict:
+    """
+    Compute a fixed-size profile of a DataFrame using vectorised pandas operations:
+    dtypes, numeric totals/means/quantiles, top categories, growth per period and a small row sample.
+    """
+    columns = list(df.columns[:MAX_COLUMNS])
+    frame = df[columns]
+    period_col = find_period_column(frame)
+    categories = _category_stats(frame, exclude=period_col)
+    strata = min(categories, key=lambda c: categories[c]["unique"]) if categories else None
+    if strata is not None and categories[strata]["unique"] > SAMPLE_ROWS:
+        strata = None
+
+    return {
+        "rows": int(len(df)),
+        "columns": int(df.shape[1]),
+        "dtypes": {col: str(dtype) for col, dtype in frame.dtypes.items()},
+        "numeric": _numeric_stats(frame),
+        "categorical": categories,
+        "growth": _period_growth(frame, period_col) if period_col is not None else None,
+        "sample": _stratified_sample(frame, strata).astype(str).apply(lambda c: c.str.slice(0, MAX_CELL_CHARS)).to_csv(index=False),
+    }
+
+def format_profile(profile: dict) -> str:
+    """Render a profile as compact text for LLM prompts."""
+    lines = [f"Rows: {profile['rows']}, Columns: {profile['columns']}"]
+    if profile["columns"] > len(profile["dtypes"]):
+        lines.append(f"(profiling the first {len(profile['dtypes'])} columns)")
+
+    lines.append("Columns:")
+    for col, dtype in profile["dtypes"].items():
+        if col in profile["numeric"]:
+            s = profile["numeric"][col]
+            lines.append(
+                f"- {col} ({dtype}): total={s['total']}, mean={s['mean']}, min={s['min']}, "
+                f"p25={s['p25']}, median={s['median']}, p75={s['p75']}, max={s['max']}, nulls={s['nulls']}"
+            )
+        elif col in profile["categorical"]:
+            s = profile["categorical"][col]
+            top = ", ".join(f"{k} ({v})" for k, v in s["top"])
+            lines.append(f"- {col} ({dtype}): {s['unique']} unique, nulls={s['nulls']}, top: {top}")
+        else:
+            lines.append(f"- {col} ({dtype})")
+
+    growth = profile.get("growth")
+    if growth:
+        lines.append(f"Totals by {growth['period_column']} ({growth['periods']} periods, last {len(growth['rows'])} shown):")
+        for row in growth["rows"]:
+            lines.append("- " + ", ".join(f"{k}={v}" for k, v in row.items()))
+        if growth["first_to_last_growth_pct"]:
+            overall = ", ".join(f"{k}={v}%" for k, v in growth["first_to_last_growth_pct"].items())
+            lines.append(f"First-to-last period growth: {overall}")
+
+    lines.append("Sample rows:")
+    lines.append(profile["sample"].strip())
+    return "\n".join(lines)
+
+# Profile text per live frame. load_csv hands out one shared, read-only frame per file, so the
+# planner prompt, the csv tool and a speculative prefetch all reuse a single profile.
+_profiles: Dict[int, Tuple[weakref.ref, Future]] = {}
+_profiles_lock = threading.Lock()
+
+def _forget_profile(key: int, ref: weakref.ref):
+    with _profiles_lock:
+        entry = _profiles.get(key)
+        if entry is not None and entry[0] is ref:
+            del _profiles[key]
+
+def summarize_dataframe(df: Optional[pd.DataFrame]) -> str:
+    """Profile text for prompts, or a placeholder when no CSV was provided."""
+    if df is None:
+        return "No CSV data"
+    key = id(df)
+    with _profiles_lock:
+        entry = _profiles.get(key)
+        owner = entry is None or entry[0]() is not df
+        if owner:
+            ref = weakref.ref(df, lambda ref, key=key: _forget_profile(key, ref))
+            entry = _profiles[key] = (ref, Future())
+    future = entry[1]
+    if owner:
+        try:
+            future.set_result(format_profile(profile_dataframe(df)))
+        except BaseException as e:
+            _forget_profile(key, entry[0])
+            future.set_exception(e)
+            raise
+    # Concurrent callers for the same frame wait for the first one's profile
+    return future.result()
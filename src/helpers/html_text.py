@@ -0,0 +1,64 @@
+# html_text.py
+
+from html.parser import HTMLParser
+from typing import List
+
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg"}
+# Opening one of these implicitly closes an open <p>
+BLOCK_TAGS = {"p", "div", "section", "article", "table", "ul", "ol", "h1", "h2", "h3",
+              "h4", "h5", "h6", "blockquote", "pre", "form", "header", "footer", "nav"}
+
+class ParagraphExtractor(HTMLParser):
+    """
+    Incremental <p> text extractor: feed() HTML chunks as they arrive and stop once
+    `done` is set, i.e. max_chars of paragraph text have been collected.
+    """
+
+    def __init__(self, max_chars: int = 5000):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.paragraphs: List[str] = []
+        self.chars = 0
+        self.done = False
+        self._current: List[str] = []
+        self._in_paragraph = False
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self._close_paragraph()
+            self._in_paragraph = tag == "p"
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag == "p":
+            self._close_paragraph()
+
+    def handle_data(self, data):
+        if self._in_paragraph and not self._skip_depth and not self.done:
+            self._current.append(data)
+
+    def _close_paragraph(self):
+        if self._in_paragraph:
+            self._in_paragraph = False
+            text = "".join(self._current)
+            self._current = []
+            self.paragraphs.append(text)
+            # +1 for the newline that joins paragraphs
+            self.chars += len(text) + 1
+            if self.chars >= self.max_chars:
+                self.done = True
+
+    def text(self) -> str:
+        """Paragraphs collected so far (including an unterminated last one), capped at max_chars."""
+        paragraphs = self.paragraphs + (["".join(self._current)] if self._in_paragraph else [])
+        return "\n".join(paragraphs)[:self.max_chars]
+
+def extract_paragraphs(html: str, max_chars: int = 5000) -> str:
+    extractor = ParagraphExtractor(max_chars)
+    extractor.feed(html)
+    extractor.close()
+    return extractor.text()
@@ -0,0 +1,92 @@
+# json_stream.py
+
+from typing import List, Optional
+
+_SIMPLE_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+class StreamingFieldParser:
+    """
+    Incremental scanner over a JSON object arriving in chunks (e.g. streamed LLM tokens).
+    feed() returns the newly decoded characters of one top-level string field as they
+    arrive, so the field can be shown before the object is complete. Text before the
+    first '{' (code fences, preambles) is ignored.
+    """
+
+    def __init__(self, field: str = "answer"):
+        self.field = field
+        self.text = ""           # everything fed so far
+        self.value = ""          # decoded value of the field so far
+        self.complete = False    # the field's closing quote has been seen
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape: Optional[str] = None
+        self._expecting_key = False
+        self._is_key = False
+        self._capturing = False
+        self._key = ""
+        self._last_key: Optional[str] = None
+
+    def feed(self, chunk: str) -> str:
+        self.text += chunk
+        emitted = []
+        for ch in chunk:
+            if self._in_string:
+                self._string_char(ch, emitted)
+            else:
+                self._structural_char(ch)
+        delta = "".join(emitted)
+        self.value += delta
+        return delta
+
+    def _structural_char(self, ch: str):
+        if not self._stack and ch != "{":
+            return
+        if ch == '"':
+            at_top = self._stack == ["{"]
+            self._in_string = True
+            self._is_key = at_top and self._expecting_key
+            self._capturing = at_top and not self._expecting_key and self._last_key == self.field
+            self._key = ""
+        elif ch in "{[":
+            self._stack.append(ch)
+            self._expecting_key = ch == "{"
+        elif ch in "}]":
+            if self._stack:
+                self._stack.pop()
+            self._expecting_key = False
+        elif ch == ":":
+            self._expecting_key = False
+        elif ch == ",":
+            self._expecting_key = bool(self._stack) and self._stack[-1] == "{"
+
+    def _string_char(self, ch: str, emitted: List[str]):
+        if self._escape is not None:
+            self._escape += ch
+            if self._escape[0] == "u" and len(self._escape) < 5:
+                return
+            if self._escape[0] == "u":
+                try:
+                    decoded = chr(int(self._escape[1:], 16))
+                except ValueError:
+                    decoded = ""
+            else:
+                decoded = _SIMPLE_ESCAPES.get(self._escape, self._escape)
+            self._escape = None
+            self._emit(decoded, emitted)
+        elif ch == "\\":
+            self._escape = ""
+        elif ch == '"':
+            self._in_string = False
+            if self._is_key:
+                self._last_key = self._key
+            elif self._capturing:
+                self.complete = True
+            self._capturing = False
+        else:
+            self._emit(ch, emitted)
+
+    def _emit(self, text: str, emitted: List[str]):
+        if self._is_key:
+            self._key += text
+        elif self._capturing:
+            emitted.append(text)
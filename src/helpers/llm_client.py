@@ -0,0 +1,328 @@
+# llm_client.py
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Type, TypeVar
+import ollama
+from pydantic import BaseModel, ValidationError
+from helpers.llm_scheduler import LLMCancelled, get_scheduler, raise_if_cancelled
+from helpers.llm_utils import parse_llm_json
+from helpers.model_config import resolve
+from helpers.singleflight import SingleFlight
+from helpers.tracing import open_span, span
+
+CACHE_ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(".cache", "llm_cache.sqlite3"))
+CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# ----------------------------
+# On-disk response cache
+# ----------------------------
+class LLMCache:
+    """
+    Content-addressed SQLite store of chat responses.
+    Entries are evicted least-recently-used first once the stored size exceeds max_bytes.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+                "size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, key: str, response: dict):
+        payload = json.dumps(response, ensure_ascii=False)
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, payload, len(payload.encode("utf-8")), time.time())
+            )
+            self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_used ASC").fetchall():
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            conn = self._connect()
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
+
+_cache = LLMCache()
+_chat_flight = SingleFlight("llm_chat")
+
+def get_cache() -> LLMCache:
+    return _cache
+
+def cache_key(model: str, messages: List[dict], options: Optional[dict] = None, format: str = "") -> str:
+    """Hash of everything that determines the model output"""
+    payload = json.dumps(
+        {"model": model, "messages": messages, "options": options or {}, "format": format},
+        sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _response_to_dict(response: Any) -> dict:
+    """Keep only the JSON-serialisable parts of an ollama response"""
+    if hasattr(response, "model_dump"):
+        response = response.model_dump()
+    response = dict(response)
+    message = dict(response.get("message") or {})
+    result = {"message": {"role": message.get("role", "assistant"), "content": message.get("content", "")}}
+    for field in ("model", "prompt_eval_count", "eval_count", "total_duration", "load_duration"):
+        if response.get(field) is not None:
+            result[field] = response[field]
+    return result
+
+def _prompt_chars(messages: List[dict]) -> int:
+    return sum(len(m.get("content") or "") for m in messages)
+
+def _record_response(s: Any, response: dict, cached: bool):
+    s.set(
+        cached=cached,
+        response_chars=len(response.get("message", {}).get("content") or ""),
+        prompt_eval_count=response.get("prompt_eval_count"),
+        eval_count=response.get("eval_count"),
+        total_duration_ms=round(response["total_duration"] / 1e6, 3) if response.get("total_duration") else None,
+    )
+
+# ----------------------------
+# Chat wrapper
+# ----------------------------
+def _chat_kwargs(task: Optional[str], model: Optional[str], messages: List[dict],
+                 options: Optional[dict], format: str) -> dict:
+    """ollama.chat arguments for a call, with the task's model, options and keep_alive filled in."""
+    config = resolve(task, model, options)
+    kwargs = {"model": config.model, "messages": messages}
+    if config.options:
+        kwargs["options"] = config.options
+    if format:
+        kwargs["format"] = format
+    if config.keep_alive:
+        kwargs["keep_alive"] = config.keep_alive
+    return kwargs
+
+def cached_chat(model: Optional[str] = None, messages: Optional[List[dict]] = None,
+                options: Optional[dict] = None, format: str = "", use_cache: bool = True,
+                task: Optional[str] = None) -> dict:
+    """
+    Drop-in replacement for ollama.chat that serves repeated prompts from the on-disk cache.
+    `task` picks the model and options from model_config (and the scheduler priority);
+    explicit model/options override them. Raises LLMCancelled if the cancel scope is cancelled.
+    Returns a dict shaped like the ollama response ({"message": {"content": ...}, ...}).
+    """
+    messages = messages or []
+    kwargs = _chat_kwargs(task, model, messages, options, format)
+    use_cache = use_cache and CACHE_ENABLED
+    key = cache_key(kwargs["model"], messages, kwargs.get("options"), format) if use_cache else None
+
+    with span("llm.chat", "llm", task=task, model=kwargs["model"], prompt_chars=_prompt_chars(messages),
+              format=format or None) as s:
+        if not use_cache:
+            response = _collect(_chat_chunks(kwargs, task, s))
+            _record_response(s, response, cached=False)
+            return response
+
+        cached = _cache.get(key)
+        if cached is not None:
+            _record_response(s, cached, cached=True)
+            return cached
+        # Identical prompts already in flight wait for that response instead of re-running it
+        try:
+            response = _chat_flight.do(key, _chat_and_store, key, kwargs, task, s)
+        except LLMCancelled:
+            # The caller that was running this prompt got cancelled; run it again unless we were too
+            raise_if_cancelled()
+            response = _chat_flight.do(key, _chat_and_store, key, kwargs, task, s)
+        _record_response(s, response, cached=False)
+        return response
+
+def _chat_and_store(key: str, kwargs: dict, task: Optional[str], s: Any) -> dict:
+    response = _collect(_chat_chunks(kwargs, task, s))
+    _cache.put(key, response)
+    return response
+
+def _chat_chunks(kwargs: dict, task: Optional[str], s: Any) -> Iterator[dict]:
+    """
+    Send a chat request once the scheduler grants a slot and yield its response chunks.
+    Requests are always streamed, so a cancelled one is closed between chunks and Ollama
+    stops generating instead of finishing an answer nobody will read.
+    """
+    with get_scheduler().slot(task) as ticket:
+        s.set(queue_ms=round(ticket.wait_seconds * 1000, 3))
+        ticket.check()
+        stream = ollama.chat(**kwargs, stream=True)
+        try:
+            for chunk in stream:
+                ticket.check()
+                yield _response_to_dict(chunk)
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+
+def _collect(chunks: Iterator[dict]) -> dict:
+    """Join streamed chunks into one response; the last chunk carries the eval counts."""
+    pieces = []
+    final: dict = {}
+    for chunk in chunks:
+        pieces.append(chunk["message"]["content"])
+        final = chunk
+    if not final:
+        final = {"message": {"role": "assistant", "content": ""}}
+    final["message"]["content"] = "".join(pieces)
+    return final
+
+def stream_chat(model: Optional[str] = None, messages: Optional[List[dict]] = None,
+                options: Optional[dict] = None, format: str = "", use_cache: bool = True,
+                task: Optional[str] = None) -> Iterator[str]:
+    """
+    Streaming variant of cached_chat: yields content pieces as the model generates them.
+    A cache hit is yielded as a single piece; a completed stream is written to the cache.
+    """
+    messages = messages or []
+    kwargs = _chat_kwargs(task, model, messages, options, format)
+    use_cache = use_cache and CACHE_ENABLED
+    key = cache_key(kwargs["model"], messages, kwargs.get("options"), format) if use_cache else None
+
+    s = open_span("llm.stream", "llm", task=task, model=kwargs["model"], prompt_chars=_prompt_chars(messages),
+                  format=format or None)
+    if use_cache:
+        cached = _cache.get(key)
+        if cached is not None:
+            _record_response(s, cached, cached=True)
+            s.end()
+            yield cached["message"]["content"]
+            return
+
+    pieces = []
+    final: dict = {}
+    chunks = _chat_chunks(kwargs, task, s)
+    try:
+        for chunk in chunks:
+            piece = chunk["message"]["content"]
+            if piece:
+                if not pieces:
+                    s.event("first_token")
+                pieces.append(piece)
+                yield piece
+            final = chunk
+    except BaseException as e:
+        # Also reached when the consumer stops early: release the slot and the connection now
+        chunks.close()
+        s.end(e)
+        raise
+
+    if final:
+        final["message"]["content"] = "".join(pieces)
+        _record_response(s, final, cached=False)
+    s.end()
+    if use_cache and final:
+        _cache.put(key, final)
+
+# ----------------------------
+# Structured output
+# ----------------------------
+JSON_RETRY_INSTRUCTION = (
+    "Your previous reply could not be parsed ({error}). "
+    "Reply again with a single valid JSON value only, no prose or code fences."
+)
+
+Model = TypeVar("Model", bound=BaseModel)
+
+def parse_into(schema: Type[Model], content: str,
+               normalize: Optional[Callable[[Any], Any]] = None) -> Model:
+    """Extract, repair and validate the JSON in an LLM reply. Raises ValueError on failure."""
+    parsed = parse_llm_json(content)
+    if normalize is not None:
+        parsed = normalize(parsed)
+    if not isinstance(parsed, dict):
+        raise ValueError(f"expected a JSON object, got {type(parsed).__name__}")
+    return schema(**parsed)
+
+def chat_json(schema: Type[Model], model: Optional[str] = None, messages: Optional[List[dict]] = None,
+              options: Optional[dict] = None, normalize: Optional[Callable[[Any], Any]] = None,
+              content: Optional[str] = None, task: Optional[str] = None) -> Model:
+    """
+    cached_chat for replies that must match a pydantic schema. If the reply can't be parsed
+    or validated, the prompt is retried once in Ollama's JSON format mode before giving up
+    with a ValueError. Pass `content` to validate a reply that was already generated.
+    """
+    messages = messages or []
+    if content is None:
+        content = cached_chat(model=model, messages=messages, options=options, task=task)["message"]["content"]
+    try:
+        return parse_into(schema, content, normalize)
+    except (ValueError, TypeError, ValidationError) as e:
+        error = e
+
+    with span("llm.json_retry", "llm", schema=schema.__name__, error=str(error)[:200]):
+        retry_messages = messages + [
+            {"role": "assistant", "content": content},
+            {"role": "user", "content": JSON_RETRY_INSTRUCTION.format(error=str(error)[:200])},
+        ]
+        content = cached_chat(model=model, messages=retry_messages, options=options, format="json",
+                              task=task)["message"]["content"]
+        try:
+            return parse_into(schema, content, normalize)
+        except TypeError as e:
+            raise ValueError(str(e)) from e
+
+def cache_stats() -> Dict[str, Any]:
+    return _cache.stats()
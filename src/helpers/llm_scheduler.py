@@ -0,0 +1,262 @@
+# llm_scheduler.py
+
+import contextvars
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# Requests sent to Ollama at once. Match the server's OLLAMA_NUM_PARALLEL: anything above
+# it only queues inside Ollama, where final answers can't overtake background summaries.
+MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", os.getenv("OLLAMA_NUM_PARALLEL", "1")))
+# Lower runs first. User-facing calls beat per-page and per-ticker summaries.
+TASK_PRIORITY: Dict[str, int] = {
+    "final_answer": 0,
+    "select_tools": 0,
+    "analyze_csv": 1,
+    "summarize_stock": 2,
+    "summarize_page": 3,
+}
+DEFAULT_PRIORITY = 2
+# A waiting request moves up one priority level per this many seconds, so summaries
+# still get through under a steady stream of final answers
+AGING_SECONDS = float(os.getenv("LLM_PRIORITY_AGING_SECONDS", "30"))
+
+class LLMCancelled(Exception):
+    """The LLM request was cancelled because its result is no longer needed."""
+
+# ----------------------------
+# Cancellation
+# ----------------------------
+class CancelScope:
+    """
+    A unit of work whose LLM requests can be cancelled together, e.g. one tool run or
+    one HTTP request. Scopes nest: cancelling a scope cancels every scope opened inside it.
+    """
+
+    def __init__(self, name: str = "", parent: Optional["CancelScope"] = None):
+        self.name = name
+        self.parent = parent
+        self.reason: Optional[str] = None
+        self._lock = threading.Lock()
+        self._children: List["CancelScope"] = []
+        self._tickets: List["Ticket"] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None or (self.parent is not None and self.parent.cancelled)
+
+    def cancel(self, reason: str = "no longer needed"):
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+            children, tickets = list(self._children), list(self._tickets)
+        for ticket in tickets:
+            ticket.cancel(reason)
+        for child in children:
+            child.cancel(reason)
+
+    def check(self):
+        """Raise LLMCancelled if this scope (or an enclosing one) was cancelled."""
+        scope = self
+        while scope is not None:
+            if scope.reason is not None:
+                raise LLMCancelled(f"{scope.name or 'request'} cancelled: {scope.reason}")
+            scope = scope.parent
+
+    def _attach(self, items: List[Any], item: Any):
+        with self._lock:
+            items.append(item)
+        if self.cancelled:
+            item.cancel(self._reason())
+
+    def _detach(self, items: List[Any], item: Any):
+        with self._lock:
+            if item in items:
+                items.remove(item)
+
+    def _reason(self) -> str:
+        scope = self
+        while scope is not None:
+            if scope.reason is not None:
+                return scope.reason
+            scope = scope.parent
+        return "no longer needed"
+
+_current_scope: contextvars.ContextVar[Optional[CancelScope]] = contextvars.ContextVar("cancel_scope", default=None)
+
+@contextmanager
+def cancel_scope(scope: Optional[CancelScope] = None, name: str = "") -> Iterator[CancelScope]:
+    """
+    Make LLM requests in this context (and threads bound to it) cancellable through `scope`.
+    Pass a scope created up front when another thread has to cancel it.
+    """
+    parent = _current_scope.get()
+    scope = scope or CancelScope(name)
+    if parent is not None and scope.parent is None and scope is not parent:
+        scope.parent = parent
+        parent._attach(parent._children, scope)
+    token = _current_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _current_scope.reset(token)
+        if scope.parent is not None:
+            scope.parent._detach(scope.parent._children, scope)
+
+def run_cancellable(scope: CancelScope, fn: Callable, *args, **kwargs) -> Any:
+    """Run fn inside `scope`, typically on a worker thread while the caller keeps the scope."""
+    with cancel_scope(scope):
+        return fn(*args, **kwargs)
+
+def current_scope() -> Optional[CancelScope]:
+    return _current_scope.get()
+
+def raise_if_cancelled():
+    scope = _current_scope.get()
+    if scope is not None:
+        scope.check()
+
+# ----------------------------
+# Scheduler
+# ----------------------------
+class Ticket:
+    """One LLM request waiting for, or holding, a scheduler slot."""
+
+    def __init__(self, scheduler: "LLMScheduler", task: Optional[str], priority: int, seq: int,
+                 scope: Optional[CancelScope]):
+        self.scheduler = scheduler
+        self.task = task or "default"
+        self.priority = priority
+        self.seq = seq
+        self.scope = scope
+        self.enqueued = time.monotonic()
+        self.granted_at: Optional[float] = None
+        self.reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    @property
+    def wait_seconds(self) -> float:
+        return (self.granted_at or time.monotonic()) - self.enqueued
+
+    def cancel(self, reason: str = "no longer needed"):
+        self.scheduler._cancel(self, reason)
+
+    def check(self):
+        """Raise LLMCancelled if the request was cancelled; streaming loops call this per chunk."""
+        if self.reason is not None:
+            raise LLMCancelled(f"{self.task} request cancelled: {self.reason}")
+
+    def effective_priority(self, now: float) -> float:
+        return self.priority - (now - self.enqueued) / AGING_SECONDS if AGING_SECONDS > 0 else self.priority
+
+class LLMScheduler:
+    """
+    Client-side admission for a shared Ollama server: at most max_in_flight requests are
+    sent at once, waiting requests are started by task priority (then arrival), and requests
+    whose cancel scope is cancelled leave the queue, or stop mid-stream, without using a slot.
+    """
+
+    def __init__(self, max_in_flight: int = MAX_IN_FLIGHT):
+        self.max_in_flight = max(1, max_in_flight)
+        self._cond = threading.Condition()
+        self._waiting: List[Ticket] = []
+        self._running = 0
+        self._seq = itertools.count()
+        self.completed = 0
+        self.cancelled = 0
+        self.max_wait: Dict[str, float] = {}
+
+    def acquire(self, task: Optional[str] = None, priority: Optional[int] = None) -> Ticket:
+        """Block until a slot is free and no higher-priority request is waiting."""
+        scope = _current_scope.get()
+        if scope is not None:
+            scope.check()
+        priority = TASK_PRIORITY.get(task or "", DEFAULT_PRIORITY) if priority is None else priority
+        ticket = Ticket(self, task, priority, next(self._seq), scope)
+        if scope is not None:
+            scope._attach(scope._tickets, ticket)
+        try:
+            with self._cond:
+                if not ticket.cancelled:  # the scope may have been cancelled while attaching
+                    self._waiting.append(ticket)
+                    self._dispatch()
+                while ticket.granted_at is None and not ticket.cancelled:
+                    self._cond.wait()
+                if ticket.granted_at is None:
+                    self.cancelled += 1
+                    ticket.check()
+            return ticket
+        except BaseException:
+            if scope is not None:
+                scope._detach(scope._tickets, ticket)
+            raise
+
+    def release(self, ticket: Ticket):
+        with self._cond:
+            self._running -= 1
+            if ticket.cancelled:
+                self.cancelled += 1
+            else:
+                self.completed += 1
+            wait = self.max_wait.get(ticket.task, 0.0)
+            self.max_wait[ticket.task] = max(wait, ticket.wait_seconds)
+            self._dispatch()
+        if ticket.scope is not None:
+            ticket.scope._detach(ticket.scope._tickets, ticket)
+
+    @contextmanager
+    def slot(self, task: Optional[str] = None, priority: Optional[int] = None) -> Iterator[Ticket]:
+        ticket = self.acquire(task, priority)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def _dispatch(self):
+        # Called with the condition held. The queue is never longer than the number of
+        # worker threads, so a linear scan (which allows aging) is cheap.
+        now = time.monotonic()
+        started = False
+        while self._waiting and self._running < self.max_in_flight:
+            ticket = min(self._waiting, key=lambda t: (t.effective_priority(now), t.seq))
+            self._waiting.remove(ticket)
+            ticket.granted_at = now
+            self._running += 1
+            started = True
+        if started:
+            self._cond.notify_all()
+
+    def _cancel(self, ticket: Ticket, reason: str):
+        with self._cond:
+            if ticket.reason is not None:
+                return
+            ticket.reason = reason
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self._running,
+                "queued": len(self._waiting),
+                "completed": self.completed,
+                "cancelled": self.cancelled,
+                "max_wait_ms": {task: round(wait * 1000, 1) for task, wait in self.max_wait.items()},
+            }
+
+_scheduler = LLMScheduler()
+
+def get_scheduler() -> LLMScheduler:
+    return _scheduler
+
+def scheduler_stats() -> Dict[str, Any]:
+    return _scheduler.stats()
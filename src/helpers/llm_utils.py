@@ -1,4 +1,6 @@
+import json
 import re
+from typing import Any
 
 def clean_llm_json_old(raw_text: str) -> str:
     """
@@ -8,17 +10,116 @@ def clean_llm_json_old(raw_text: str) -> str:
     return cleaned.strip()
 
 
+def extract_json_block(raw_output: str) -> str:
+    """
+    Return the first balanced JSON object or array in LLM output, ignoring surrounding
+    prose and code fences. Single pass; brackets inside strings don't count. If the
+    output was cut off mid-object, everything from the opening bracket is returned.
+    """
+    start = -1
+    depth = 0
+    quote = ""
+    escaped = False
+    for i, ch in enumerate(raw_output):
+        if quote:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == quote:
+                quote = ""
+        elif ch in "{[":
+            if depth == 0:
+                start = i
+            depth += 1
+        elif ch in "}]" and depth:
+            depth -= 1
+            if depth == 0:
+                return raw_output[start:i + 1]
+        elif ch in "\"'" and depth:
+            quote = ch
+    if start >= 0:
+        return raw_output[start:]
+    return raw_output.strip()
+
+def repair_json(text: str) -> str:
+    """
+    Light single-pass repair of near-JSON: single-quoted strings, trailing commas,
+    Python True/False/None and brackets left open by truncated output.
+    """
+    out = []
+    closers = []
+    quote = ""
+    escaped = False
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if quote:
+            if escaped:
+                escaped = False
+                out.append(ch)
+            elif ch == "\\":
+                escaped = True
+                out.append(ch)
+            elif ch == quote:
+                quote = ""
+                out.append('"')
+            elif ch == '"':  # a double quote inside a single-quoted string
+                out.append('\\"')
+            elif ch == "\n":
+                out.append("\\n")
+            else:
+                out.append(ch)
+        elif ch in "\"'":
+            quote = ch
+            out.append('"')
+        elif ch in "{[":
+            closers.append("}" if ch == "{" else "]")
+            out.append(ch)
+        elif ch in "}]":
+            # Drop a trailing comma before the closing bracket
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            if closers:
+                closers.pop()
+            out.append(ch)
+        elif ch.isalpha():
+            j = i
+            while j < len(text) and (text[j].isalnum() or text[j] == "_"):
+                j += 1
+            word = text[i:j]
+            out.append(_PY_LITERALS.get(word, word))
+            i = j
+            continue
+        else:
+            out.append(ch)
+        i += 1
+
+    if quote:
+        out.append('"')
+    while out and (out[-1].isspace() or out[-1] == ","):
+        out.pop()
+    out.extend(reversed(closers))
+    return "".join(out)
+
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+def parse_llm_json(raw_output: str) -> Any:
+    """
+    Parse the JSON embedded in LLM output, repairing it if needed.
+    Raises json.JSONDecodeError if it can't be recovered.
+    """
+    block = extract_json_block(raw_output)
+    try:
+        return json.loads(block)
+    except json.JSONDecodeError:
+        return json.loads(repair_json(block))
+
 def clean_llm_json(raw_output: str) -> str:
     """
     Extracts the first valid JSON object or array from LLM output,
     even if extra text surrounds it.
     """
-    # Remove code block markers
-    raw_output = raw_output.strip().strip("`")
-    raw_output = raw_output.replace("json\n", "").replace("json", "").strip()
-
-    # Regex: find first {...} or [...]
-    match = re.search(r'(\{.*\}|\[.*\])', raw_output, re.DOTALL)
-    if match:
-        return match.group(1)
-    return raw_output
\ No newline at end of file
+    return extract_json_block(raw_output)
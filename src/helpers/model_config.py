@@ -0,0 +1,92 @@
+# model_config.py
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+from pydantic import BaseModel
+import ollama
+from helpers.tracing import log_status, span
+
+DEFAULT_MODEL = os.getenv("LLM_MODEL", "gemma3:4b")
+# How long Ollama keeps a model loaded after its last request
+KEEP_ALIVE = os.getenv("LLM_KEEP_ALIVE", "30m")
+# Context window requested for every task. Ollama reloads a model whenever num_ctx
+# changes, so tasks sharing a model must share this value.
+NUM_CTX = int(os.getenv("LLM_NUM_CTX", os.getenv("MODEL_CONTEXT_TOKENS", "4096")))
+WARMUP_ENABLED = os.getenv("LLM_WARMUP", "1") != "0"
+
+class ModelConfig(BaseModel):
+    model: str
+    options: Dict[str, Any] = {}
+    keep_alive: Optional[str] = KEEP_ALIVE
+
+    def prompt_budget(self) -> int:
+        """Tokens available for the prompt once room is left for the longest reply."""
+        return self.options.get("num_ctx", NUM_CTX) - self.options.get("num_predict", 1024)
+
+# Output caps per task: short summaries and tool plans stop early instead of rambling.
+# Any task's model can be swapped for a smaller one with LLM_MODEL_<TASK>, e.g.
+# LLM_MODEL_SUMMARIZE_PAGE=gemma3:1b.
+TASK_OPTIONS: Dict[str, Dict[str, Any]] = {
+    "select_tools": {"num_predict": 256, "temperature": 0},
+    "summarize_page": {"num_predict": 160},
+    "summarize_stock": {"num_predict": 200},
+    "analyze_csv": {"num_predict": 400},
+    "final_answer": {"num_predict": 1024},
+    "default": {},
+}
+
+def _task_config(task: str, options: Dict[str, Any]) -> ModelConfig:
+    return ModelConfig(
+        model=os.getenv(f"LLM_MODEL_{task.upper()}", DEFAULT_MODEL),
+        options={"num_ctx": NUM_CTX, **options},
+    )
+
+MODEL_CONFIGS: Dict[str, ModelConfig] = {task: _task_config(task, options) for task, options in TASK_OPTIONS.items()}
+
+def get_model_config(task: Optional[str] = None) -> ModelConfig:
+    return MODEL_CONFIGS.get(task or "default", MODEL_CONFIGS["default"])
+
+def resolve(task: Optional[str], model: Optional[str], options: Optional[dict]) -> ModelConfig:
+    """The config for a call: the task's settings with explicit model/options taking precedence."""
+    config = get_model_config(task)
+    return ModelConfig(
+        model=model or config.model,
+        options={**config.options, **(options or {})},
+        keep_alive=config.keep_alive,
+    )
+
+# ----------------------------
+# Warm-up
+# ----------------------------
+def _warm_model(config: ModelConfig) -> Optional[str]:
+    with span("llm.warmup", "llm", model=config.model):
+        try:
+            # An empty prompt loads the model (with this num_ctx) without generating anything
+            ollama.generate(model=config.model, prompt="", keep_alive=config.keep_alive,
+                            options={"num_ctx": config.options.get("num_ctx", NUM_CTX)})
+            return None
+        except Exception as e:
+            return str(e)
+
+def warm_up_models(tasks: Optional[Iterable[str]] = None) -> Dict[str, Optional[str]]:
+    """
+    Load every model the given tasks (default: all) use, in parallel, so the first request
+    doesn't pay the load time. Returns model -> error message (None when loaded).
+    """
+    if not WARMUP_ENABLED:
+        return {}
+    configs: Dict[str, ModelConfig] = {}
+    for task in tasks or MODEL_CONFIGS:
+        config = get_model_config(task)
+        configs.setdefault(config.model, config)
+
+    models: List[str] = list(configs)
+    with ThreadPoolExecutor(max_workers=max(1, len(models))) as pool:
+        errors = dict(zip(models, pool.map(_warm_model, configs.values())))
+    for model, error in errors.items():
+        if error:
+            log_status("WARM-UP", f"Could not preload {model}: {error}")
+        else:
+            log_status("WARM-UP", f"Model {model} loaded (keep_alive {configs[model].keep_alive})")
+    return errors
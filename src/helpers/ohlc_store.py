@@ -0,0 +1,156 @@
+# ohlc_store.py
+
+import datetime as dt
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+import pandas as pd
+import yfinance as yf
+from helpers.tracing import log_status, span
+
+try:
+    import pyarrow  # noqa: F401  (Parquet engine)
+    STORE_FORMAT = "parquet"
+except ImportError:
+    STORE_FORMAT = "pkl"
+
+OHLC_STORE_DIR = os.getenv("OHLC_STORE_DIR", os.path.join(".cache", "ohlc"))
+# A stored series fetched this recently is treated as up to date (the latest bar may still be moving)
+REFRESH_SECONDS = float(os.getenv("OHLC_REFRESH_SECONDS", str(15 * 60)))
+# Gaps this short at the start of a window are weekends/holidays, not missing data
+MAX_GAP_DAYS = 4
+
+OHLC_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+def _empty_frame() -> pd.DataFrame:
+    return pd.DataFrame(columns=OHLC_COLUMNS, index=pd.DatetimeIndex([], name='Date'), dtype='float64')
+
+def _ticker_frame(data: pd.DataFrame, ticker: str) -> pd.DataFrame:
+    """
+    Pull one ticker's OHLC columns out of a (possibly multi-ticker) yf.download frame.
+    A ticker yfinance returned nothing for (e.g. delisted) gives an empty frame.
+    """
+    if isinstance(data.columns, pd.MultiIndex):
+        if ticker in data.columns.get_level_values(0):
+            data = data[ticker]
+        elif ticker in data.columns.get_level_values(1):
+            data = data.xs(ticker, axis=1, level=1)
+        else:
+            return _empty_frame()
+    if data.empty:
+        return _empty_frame()
+    frame = data.reindex(columns=OHLC_COLUMNS).dropna(subset=['Open', 'High', 'Low', 'Close'])
+    frame.index = pd.DatetimeIndex(frame.index).tz_localize(None).normalize()
+    frame.index.name = 'Date'
+    # A single float64 block keeps window slices zero-copy views
+    return frame.astype('float64')
+
+class OHLCStore:
+    """
+    Per-ticker daily OHLC history kept on disk (Parquet, or pickle without pyarrow) and in memory.
+    Only the date range not already stored is downloaded, batched across tickers.
+    """
+
+    def __init__(self, root: str = OHLC_STORE_DIR):
+        self.root = root
+        self._frames: Dict[str, pd.DataFrame] = {}
+        self._fetched_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, ticker: str) -> str:
+        return os.path.join(self.root, f"{ticker.upper()}.{STORE_FORMAT}")
+
+    def _load(self, ticker: str) -> Optional[pd.DataFrame]:
+        if ticker not in self._frames:
+            path = self._path(ticker)
+            if not os.path.exists(path):
+                return None
+            try:
+                frame = pd.read_parquet(path) if STORE_FORMAT == "parquet" else pd.read_pickle(path)
+            except Exception as e:
+                log_status("OHLC STORE", f"Ignoring unreadable OHLC store {path}: {e}")
+                return None
+            self._frames[ticker] = frame
+            self._fetched_at[ticker] = os.path.getmtime(path)
+        return self._frames[ticker]
+
+    def _save(self, ticker: str, frame: pd.DataFrame):
+        os.makedirs(self.root, exist_ok=True)
+        path = self._path(ticker)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if STORE_FORMAT == "parquet":
+            frame.to_parquet(tmp_path)
+        else:
+            frame.to_pickle(tmp_path)
+        os.replace(tmp_path, path)
+        self._frames[ticker] = frame
+        self._fetched_at[ticker] = time.time()
+
+    def _missing_range(self, ticker: str, start: dt.date, end: dt.date) -> Optional[Tuple[dt.date, dt.date]]:
+        """The [start, end) range that still has to be downloaded for this ticker, if any."""
+        frame = self._load(ticker)
+        if frame is None or frame.empty:
+            return start, end
+        first, last = frame.index[0].date(), frame.index[-1].date()
+        if (start - first).days < -MAX_GAP_DAYS:
+            # Window reaches further back than what is stored: fetch everything from the new start
+            return start, end
+        if time.time() - self._fetched_at.get(ticker, 0) < REFRESH_SECONDS:
+            return None
+        # Re-fetch the last stored bar too, since it may have been a partial day
+        return last, end
+
+    def update(self, tickers: List[str], start: dt.date, end: dt.date):
+        """Download only the missing ranges, one yf.download call per distinct range."""
+        with self._lock:
+            ranges = defaultdict(list)
+            for ticker in tickers:
+                missing = self._missing_range(ticker, start, end)
+                if missing is not None:
+                    ranges[missing].append(ticker)
+
+            for (fetch_start, fetch_end), batch in ranges.items():
+                with span("yfinance.download", "yfinance", tickers=batch,
+                          start=str(fetch_start), end=str(fetch_end)) as s:
+                    data = yf.download(batch, start=fetch_start, end=fetch_end, group_by="ticker", progress=False)
+                    s.set(rows=len(data))
+                    empty = []
+                    for ticker in batch:
+                        fresh = _ticker_frame(data, ticker)
+                        if fresh.empty:
+                            # Keep whatever is stored; the chart shows the ticker as having no data
+                            empty.append(ticker)
+                            continue
+                        self._merge(ticker, fresh)
+                    s.set(empty=empty)
+                if empty:
+                    log_status("OHLC STORE", f"No price history returned for {empty}")
+
+    def _merge(self, ticker: str, fresh: pd.DataFrame):
+        stored = self._load(ticker)
+        if stored is not None and not stored.empty:
+            fresh = pd.concat([stored[~stored.index.isin(fresh.index)], fresh]).sort_index()
+        self._save(ticker, fresh)
+
+    def window(self, ticker: str, start: dt.date, end: dt.date) -> pd.DataFrame:
+        """Stored bars in [start, end]; a slice of the stored frame, not a copy."""
+        frame = self._load(ticker)
+        if frame is None:
+            return _empty_frame()
+        return frame.loc[pd.Timestamp(start):pd.Timestamp(end)]
+
+_store = OHLCStore()
+
+def get_ohlc_store() -> OHLCStore:
+    return _store
+
+def get_history(tickers: List[str], days: int, end: Optional[dt.date] = None) -> Dict[str, pd.DataFrame]:
+    """Daily OHLC bars for the last `days` days for each ticker, fetched incrementally."""
+    tickers = [ticker.upper() for ticker in tickers]
+    end = end or dt.date.today()
+    start = end - dt.timedelta(days=days)
+    # yfinance treats `end` as exclusive, so ask for one day past today
+    _store.update(tickers, start, end + dt.timedelta(days=1))
+    return {ticker: _store.window(ticker, start, end) for ticker in tickers}
@@ -0,0 +1,87 @@
+# prompt_builder.py
+
+import json
+import math
+import os
+from typing import Any, Dict, List, Optional
+
+# Ollama's default num_ctx; prompts beyond it are silently truncated from the front
+MODEL_CONTEXT_TOKENS = int(os.getenv("MODEL_CONTEXT_TOKENS", "4096"))
+# Room left for the model's reply
+RESPONSE_TOKENS = int(os.getenv("RESPONSE_TOKENS", "1024"))
+# Rough average for English text and JSON with SentencePiece-style tokenizers
+CHARS_PER_TOKEN = 4.0
+# A section that can't keep at least this many tokens is dropped rather than truncated
+MIN_SECTION_TOKENS = 32
+TRUNCATION_MARK = "... (truncated)"
+
+def count_tokens(text: str) -> int:
+    """Estimated token count; cheap enough to call on every section."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def compact_json(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+
+def prune_empty(value: Any) -> Any:
+    """Drop None, empty strings and empty containers from nested dicts and lists."""
+    if isinstance(value, dict):
+        pruned = {k: prune_empty(v) for k, v in value.items()}
+        return {k: v for k, v in pruned.items() if v not in (None, "", [], {})}
+    if isinstance(value, list):
+        return [v for v in (prune_empty(v) for v in value) if v not in (None, "", [], {})]
+    return value
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to roughly max_tokens, preferring a line boundary so JSON lines stay whole."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    limit = max(0, int(max_tokens * CHARS_PER_TOKEN) - len(TRUNCATION_MARK) - 1)
+    cut = text[:limit]
+    newline = cut.rfind("\n")
+    if newline > limit // 2:
+        cut = cut[:newline]
+    return cut.rstrip() + "\n" + TRUNCATION_MARK
+
+class PromptBuilder:
+    """
+    Assemble a prompt from sections within a token budget. Sections without a priority
+    are always kept whole; the others are fitted highest priority first, so when the
+    budget runs out it is the lowest-priority content that gets truncated or dropped.
+    """
+
+    def __init__(self, budget_tokens: int = MODEL_CONTEXT_TOKENS - RESPONSE_TOKENS):
+        self.budget_tokens = budget_tokens
+        self._sections: List[Dict[str, Any]] = []
+        self.stats: Dict[str, Any] = {}
+
+    def add(self, text: str, priority: Optional[int] = None, name: Optional[str] = None) -> "PromptBuilder":
+        if text:
+            self._sections.append({"name": name or f"section{len(self._sections)}", "text": text.strip("\n"),
+                                   "priority": priority})
+        return self
+
+    def build(self) -> str:
+        remaining = self.budget_tokens - sum(
+            count_tokens(s["text"]) for s in self._sections if s["priority"] is None
+        )
+        fitted: Dict[int, str] = {}
+        truncated, dropped = [], []
+        flexible = [i for i, s in enumerate(self._sections) if s["priority"] is not None]
+        for i in sorted(flexible, key=lambda i: -self._sections[i]["priority"]):
+            section = self._sections[i]
+            tokens = count_tokens(section["text"])
+            if tokens <= remaining:
+                fitted[i] = section["text"]
+            elif remaining >= MIN_SECTION_TOKENS:
+                fitted[i] = truncate_to_tokens(section["text"], remaining)
+                truncated.append(section["name"])
+            else:
+                dropped.append(section["name"])
+                continue
+            remaining -= count_tokens(fitted[i])
+
+        parts = [s["text"] if s["priority"] is None else fitted.get(i) for i, s in enumerate(self._sections)]
+        prompt = "\n\n".join(p for p in parts if p)
+        self.stats = {"tokens": count_tokens(prompt), "budget": self.budget_tokens,
+                      "truncated": truncated, "dropped": dropped}
+        return prompt
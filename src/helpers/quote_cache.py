@@ -0,0 +1,90 @@
+# quote_cache.py
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+
+QUOTE_CACHE_ENABLED = os.getenv("QUOTE_CACHE", "1") != "0"
+QUOTE_CACHE_PATH = os.getenv("QUOTE_CACHE_PATH", os.path.join(".cache", "quotes.sqlite3"))
+QUOTE_TTL_SECONDS = float(os.getenv("QUOTE_TTL_SECONDS", "60"))
+SHARES_TTL_SECONDS = float(os.getenv("SHARES_TTL_SECONDS", str(24 * 60 * 60)))
+
+QUOTE_FIELDS = ["lastPrice", "marketCap", "yearHigh", "yearLow", "sharesOutstanding"]
+
+# How long each field stays fresh; prices move every tick, share counts almost never
+FIELD_TTLS: Dict[str, float] = {field: QUOTE_TTL_SECONDS for field in QUOTE_FIELDS}
+FIELD_TTLS["sharesOutstanding"] = SHARES_TTL_SECONDS
+
+class QuoteCache:
+    """
+    Two-level (in-process dict over SQLite) cache of quote fields per symbol.
+    Each field is stored with its fetch time and expires after its own TTL.
+    """
+
+    def __init__(self, path: str = QUOTE_CACHE_PATH, ttls: Optional[Dict[str, float]] = None):
+        self.path = path
+        self.ttls = ttls or FIELD_TTLS
+        self._memory: Dict[str, Dict[str, tuple]] = {}
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS quotes ("
+                "symbol TEXT NOT NULL, field TEXT NOT NULL, value REAL, fetched_at REAL NOT NULL, "
+                "PRIMARY KEY (symbol, field))"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _load(self, symbol: str) -> Dict[str, tuple]:
+        if symbol not in self._memory:
+            rows = self._connect().execute(
+                "SELECT field, value, fetched_at FROM quotes WHERE symbol = ?", (symbol,)
+            ).fetchall()
+            self._memory[symbol] = {field: (value, fetched_at) for field, value, fetched_at in rows}
+        return self._memory[symbol]
+
+    def get(self, symbol: str, fields: Iterable[str] = QUOTE_FIELDS, now: Optional[float] = None) -> Dict[str, Any]:
+        """Return the fields of a symbol that are still within their TTL."""
+        now = time.time() if now is None else now
+        with self._lock:
+            stored = self._load(symbol)
+            return {
+                field: stored[field][0]
+                for field in fields
+                if field in stored and now - stored[field][1] < self.ttls.get(field, QUOTE_TTL_SECONDS)
+            }
+
+    def put(self, symbol: str, values: Dict[str, Any], now: Optional[float] = None):
+        now = time.time() if now is None else now
+        with self._lock:
+            stored = self._load(symbol)
+            conn = self._connect()
+            for field, value in values.items():
+                # yfinance hands back numpy scalars, which sqlite cannot bind
+                value = float(value) if value is not None else None
+                stored[field] = (value, now)
+                conn.execute(
+                    "INSERT OR REPLACE INTO quotes (symbol, field, value, fetched_at) VALUES (?, ?, ?, ?)",
+                    (symbol, field, value, now)
+                )
+            conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            conn = self._connect()
+            conn.execute("DELETE FROM quotes")
+            conn.commit()
+
+_cache = QuoteCache()
+
+def get_quote_cache() -> QuoteCache:
+    return _cache
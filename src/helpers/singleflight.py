@@ -0,0 +1,129 @@
+# singleflight.py
+
+import contextvars
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+_registry: List["SingleFlight"] = []
+_registry_lock = threading.Lock()
+# flight name -> key -> result, for the current request_memo() scope
+_scoped_memo: contextvars.ContextVar[Optional[Dict[str, Dict[Hashable, Any]]]] = contextvars.ContextVar(
+    "singleflight_memo", default=None
+)
+
+class SingleFlight:
+    """
+    Collapse concurrent calls for the same key into a single execution: the first caller
+    runs it, later callers wait for its result. Inside batch_memo() results are also kept,
+    so identical sub-requests across a whole batch run only once; inside request_memo()
+    they are kept for that context only. Failures (fail()) are never kept. Flights whose
+    results go stale within a batch (e.g. quotes) pass batch_scope=False.
+    """
+
+    def __init__(self, name: str, batch_scope: bool = True):
+        self.name = name
+        self.batch_scope = batch_scope
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self._memo: Optional[Dict[Hashable, Any]] = None
+        self.deduped = 0
+        with _registry_lock:
+            _registry.append(self)
+
+    def claim(self, keys: Iterable[Hashable]) -> Tuple[List[Hashable], Dict[Hashable, Future]]:
+        """
+        Split keys into those the caller must compute (and later resolve/fail) and
+        futures for those already computed or in flight elsewhere.
+        """
+        mine, others = [], {}
+        scoped = self._scoped()
+        with self._lock:
+            for key in keys:
+                memo = next((m for m in (scoped, self._memo) if m is not None and key in m), None)
+                if memo is not None:
+                    done = Future()
+                    done.set_result(memo[key])
+                    others[key] = done
+                    self.deduped += 1
+                elif key in self._calls:
+                    others[key] = self._calls[key]
+                    self.deduped += 1
+                else:
+                    self._calls[key] = Future()
+                    mine.append(key)
+        return mine, others
+
+    def resolve(self, key: Hashable, result: Any):
+        scoped = self._scoped()
+        with self._lock:
+            future = self._calls.pop(key)
+            if self._memo is not None:
+                self._memo[key] = result
+            if scoped is not None:
+                scoped[key] = result
+        future.set_result(result)
+
+    def _scoped(self) -> Optional[Dict[Hashable, Any]]:
+        memos = _scoped_memo.get()
+        if memos is None:
+            return None
+        with self._lock:
+            return memos.setdefault(self.name, {})
+
+    def fail(self, key: Hashable, error: BaseException):
+        with self._lock:
+            future = self._calls.pop(key)
+        future.set_exception(error)
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        mine, others = self.claim([key])
+        if not mine:
+            return others[key].result()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self.fail(key, e)
+            raise
+        self.resolve(key, result)
+        return result
+
+    def _start_memo(self):
+        if not self.batch_scope:
+            return
+        with self._lock:
+            self._memo = {}
+
+    def _stop_memo(self):
+        with self._lock:
+            self._memo = None
+
+@contextmanager
+def batch_memo():
+    """Keep single-flight results for the duration of a batch run."""
+    with _registry_lock:
+        flights = list(_registry)
+    for flight in flights:
+        flight._start_memo()
+    try:
+        yield
+    finally:
+        for flight in flights:
+            flight._stop_memo()
+
+@contextmanager
+def request_memo():
+    """
+    Keep single-flight results for this context and the threads bound to it (one request),
+    so work started early, e.g. speculatively, is picked up by the calls that need it.
+    """
+    token = _scoped_memo.set({})
+    try:
+        yield
+    finally:
+        _scoped_memo.reset(token)
+
+def dedupe_stats() -> Dict[str, int]:
+    with _registry_lock:
+        return {flight.name: flight.deduped for flight in _registry}
@@ -1,29 +1,51 @@
-import datetime as dt
-import yfinance as yf
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, List, Optional
+import matplotlib
+matplotlib.use('Agg')  # headless: charts are written to files, never shown
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+import pandas as pd
 from mplfinance.original_flavor import candlestick_ohlc
-import matplotlib
-matplotlib.use('TkAgg')
-
+from helpers import ohlc_store
+from helpers.tracing import log_status
 
+CHART_DIR = os.getenv("CHART_DIR", os.path.join("data", "charts"))  # untracked; data/*.png are the README examples
+CHART_FORMAT = os.getenv("CHART_FORMAT", "png")
+CHART_WORKERS = 2
+HISTORY_DAYS = 6 * 30  # last ~6 months
 
 plt.rcParams['font.family'] = 'monospace'
 
-def visualize(tickers: list):
-    end = dt.datetime.today()
-    start = end - dt.timedelta(days=6*30)  # last ~6 months
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def chart_path(tickers: List[str], fmt: str = CHART_FORMAT, out_dir: str = CHART_DIR) -> str:
+    return os.path.join(out_dir, f"{'_'.join(t.upper() for t in tickers)}_graph.{fmt}")
+
+def download_history(tickers: List[str], days: int = HISTORY_DAYS) -> Dict[str, pd.DataFrame]:
+    """OHLC history for every ticker, read from the local store (which only fetches missing days)."""
+    return ohlc_store.get_history(tickers, days)
+
+def render_chart(tickers: List[str], fmt: str = CHART_FORMAT, out_dir: str = CHART_DIR) -> str:
+    """Draw candlestick charts for all tickers into one figure and save it; returns the file path."""
+    history = download_history([t.upper() for t in tickers])
 
     # Create one figure with len(tickers) subplots
     fig, axes = plt.subplots(len(tickers), 1, figsize=(10, 4*len(tickers)), squeeze=False)
     axes = axes.flatten()  # ensure it's a 1D array even if only 1 ticker
 
     for ax, ticker in zip(axes, tickers):
-        # Download data
-        data = yf.download(ticker, start=start, end=end)
-        data = data[['Open', 'High', 'Low', 'Close']]
-        data.reset_index(inplace=True)
-        data['Date'] = data['Date'].map(mdates.date2num)
+        data = history[ticker.upper()]
+        if data.empty:
+            # Delisted or unknown: leave a labelled blank panel rather than failing the whole figure
+            ax.set_title(f'{ticker} (no price data)', color='black')
+            ax.axis('off')
+            continue
+        ohlc = data[['Open', 'High', 'Low', 'Close']].reset_index(drop=True)
+        ohlc.insert(0, 'Date', mdates.date2num(data.index.to_pydatetime()))
 
         # Style the subplot
         ax.grid(True, color='lightgray')
@@ -37,16 +59,49 @@ def visualize(tickers: list):
         ax.xaxis_date()
 
         # Plot candlestick chart
-        candlestick_ohlc(ax, data.values, width=0.5, colorup='#2ECC71', colordown='#E74C3C')
+        candlestick_ohlc(ax, ohlc.values, width=0.5, colorup='#2ECC71', colordown='#E74C3C')
 
     plt.tight_layout()
-    plt.show(block=False)
-    plt.pause(15)  # show for 15 seconds before continuing
+    path = chart_path(tickers, fmt, out_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    fig.savefig(path, format=fmt)
     plt.close(fig)
+    return path
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Spawned, not forked: this runs on a worker thread while locks, pools and SQLite
+            # handles are live, and a forked child would inherit them mid-use
+            _executor = ProcessPoolExecutor(max_workers=CHART_WORKERS,
+                                            mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+def visualize(tickers: list, block: bool = False, fmt: str = CHART_FORMAT):
+    """
+    Render the tickers' charts off the request path in a background process.
+    Returns a Future resolving to the chart path, or the path itself when block=True.
+    """
+    tickers = list(tickers)
+    if block:
+        return render_chart(tickers, fmt)
+    future: Future = _get_executor().submit(render_chart, tickers, fmt)
+    future.add_done_callback(_report_chart)
+    return future
+
+def _report_chart(future: Future):
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        log_status("CHARTS", f"Unable to render stock chart: {error}")
+    else:
+        log_status("CHARTS", f"Stock chart saved to: {future.result()}")
 
 
 
 # Example usage:
 
 # tickers = ['AAPL', 'MSFT', 'GOOGL']
-# visualize(tickers)
\ No newline at end of file
+# print(visualize(tickers, block=True))
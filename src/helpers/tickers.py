@@ -0,0 +1,12 @@
+# tickers.py
+
+import re
+from typing import List
+
+TICKER_PATTERN = re.compile(r'\b[A-Z]{2,5}\b')
+# All-caps words that look like tickers but aren't
+NON_TICKER_WORDS = {"API", "CSV", "AI", "UK", "US", "USA", "EU", "CEO", "CFO", "GDP", "ETF", "IPO", "JSON", "FY", "YOY", "QOQ"}
+
+def find_tickers(text: str) -> List[str]:
+    """Ticker-like words in first-seen order, so prompts (and their cache keys) are stable between runs."""
+    return [t for t in dict.fromkeys(TICKER_PATTERN.findall(text)) if t not in NON_TICKER_WORDS]
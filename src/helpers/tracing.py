@@ -0,0 +1,202 @@
+# tracing.py
+
+import atexit
+import contextvars
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+TRACE_FILE = os.getenv("TRACE_FILE")  # "*.json" -> Chrome trace, anything else -> JSON lines
+MAX_SPANS = 100_000  # oldest spans are dropped beyond this, so long-running processes stay bounded
+
+_enabled = bool(TRACE_FILE)
+_spans: "deque[Span]" = deque(maxlen=MAX_SPANS)
+_spans_lock = threading.Lock()
+_ids = itertools.count(1)
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    """One timed operation. Spans nest through a context variable, including across bind()-ed threads."""
+
+    __slots__ = ("span_id", "parent_id", "name", "category", "attrs", "events",
+                 "start_wall", "start", "duration", "thread_id", "error")
+
+    def __init__(self, name: str, category: str, parent: Optional["Span"], attrs: Dict[str, Any]):
+        self.span_id = next(_ids)
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.category = category
+        self.attrs = attrs
+        self.events: List[dict] = []
+        self.start_wall = time.time()
+        self.start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.thread_id = threading.get_ident()
+        self.error: Optional[str] = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def event(self, message: str, **attrs):
+        self.events.append({"offset_ms": round((time.perf_counter() - self.start) * 1000, 3),
+                            "message": message, **attrs})
+
+    def end(self, error: Optional[BaseException] = None):
+        self.duration = time.perf_counter() - self.start
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        with _spans_lock:
+            _spans.append(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "category": self.category,
+            "start": self.start_wall,
+            "duration_ms": round((self.duration or 0.0) * 1000, 3),
+            "thread_id": self.thread_id,
+            "attrs": self.attrs,
+            "events": self.events,
+            "error": self.error,
+        }
+
+class _NoopSpan:
+    def set(self, **attrs):
+        pass
+
+    def event(self, message: str, **attrs):
+        pass
+
+    def end(self, error: Optional[BaseException] = None):
+        pass
+
+_NOOP = _NoopSpan()
+
+# ----------------------------
+# Recording
+# ----------------------------
+def enable_tracing(path: Optional[str] = None):
+    """Start recording spans; with a path they are also exported there at process exit."""
+    global _enabled, TRACE_FILE
+    _enabled = True
+    if path:
+        TRACE_FILE = path
+
+def tracing_enabled() -> bool:
+    return _enabled
+
+@contextmanager
+def span(name: str, category: str = "stage", **attrs) -> Iterator[Any]:
+    """Time the enclosed block as a child of the current span."""
+    if not _enabled:
+        yield _NOOP
+        return
+    current = Span(name, category, _current.get(), attrs)
+    token = _current.set(current)
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _current.reset(token)
+        current.end(error)
+
+def open_span(name: str, category: str = "stage", **attrs) -> Any:
+    """
+    Start a child of the current span without making it current; the caller must end() it.
+    For generators, whose body runs in the consumer's context between yields.
+    """
+    if not _enabled:
+        return _NOOP
+    return Span(name, category, _current.get(), attrs)
+
+def traced(name: str, category: str = "stage"):
+    """Decorator form of span()."""
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, category):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def bind(fn: Callable) -> Callable:
+    """Carry the caller's current span into a function that will run on another thread."""
+    ctx = contextvars.copy_context()
+    return functools.partial(ctx.run, fn)
+
+def current_span() -> Any:
+    return _current.get() or _NOOP
+
+def log_status(stage: str, message: str):
+    """Prints formatted debug messages for visibility, and records them on the current span."""
+    print(f"[DEBUG] [{stage}] {message}")
+    current = _current.get()
+    if current is not None:
+        current.event(message, stage=stage)
+
+# ----------------------------
+# Export
+# ----------------------------
+def get_spans() -> List[dict]:
+    with _spans_lock:
+        return [s.to_dict() for s in _spans]
+
+def clear_spans():
+    with _spans_lock:
+        _spans.clear()
+
+def summarize_spans() -> Dict[str, dict]:
+    """Count, total and max duration per span name."""
+    summary: Dict[str, dict] = {}
+    for s in get_spans():
+        entry = summary.setdefault(s["name"], {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+        entry["count"] += 1
+        entry["total_ms"] = round(entry["total_ms"] + s["duration_ms"], 3)
+        entry["max_ms"] = max(entry["max_ms"], s["duration_ms"])
+    return summary
+
+def export_jsonl(path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        for s in get_spans():
+            f.write(json.dumps(s, ensure_ascii=False, default=str) + "\n")
+
+def export_chrome_trace(path: str):
+    """Write spans in the Chrome trace event format (open in chrome://tracing or Perfetto)."""
+    pid = os.getpid()
+    events = []
+    for s in get_spans():
+        ts = s["start"] * 1_000_000
+        events.append({
+            "name": s["name"], "cat": s["category"], "ph": "X", "ts": ts,
+            "dur": s["duration_ms"] * 1000, "pid": pid, "tid": s["thread_id"],
+            "args": {**s["attrs"], "span_id": s["span_id"], "parent_id": s["parent_id"], "error": s["error"]},
+        })
+        for e in s["events"]:
+            events.append({
+                "name": e["message"], "cat": s["category"], "ph": "i", "s": "t",
+                "ts": ts + e["offset_ms"] * 1000, "pid": pid, "tid": s["thread_id"],
+            })
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=str)
+
+def export_trace(path: str):
+    if path.endswith(".json"):
+        export_chrome_trace(path)
+    else:
+        export_jsonl(path)
+
+@atexit.register
+def _export_at_exit():
+    if _enabled and TRACE_FILE:
+        export_trace(TRACE_FILE)
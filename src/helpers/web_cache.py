@@ -0,0 +1,132 @@
+# web_cache.py
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+WEB_CACHE_ENABLED = os.getenv("WEB_CACHE", "1") != "0"
+WEB_CACHE_PATH = os.getenv("WEB_CACHE_PATH", os.path.join(".cache", "web.sqlite3"))
+SEARCH_TTL_SECONDS = float(os.getenv("SEARCH_TTL_SECONDS", str(6 * 60 * 60)))
+# Pages validated this recently are reused without contacting the server at all
+PAGE_FRESH_SECONDS = float(os.getenv("PAGE_FRESH_SECONDS", str(10 * 60)))
+# Pages not seen for this long are dropped
+PAGE_MAX_AGE_SECONDS = float(os.getenv("PAGE_MAX_AGE_SECONDS", str(7 * 24 * 60 * 60)))
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+class WebCache:
+    """
+    SQLite cache of SerpAPI results (per normalized query and result count, with a TTL)
+    and of scraped pages (per URL: validators, extracted text and summary), so pages
+    can be revalidated with conditional GETs instead of re-downloaded and re-summarised.
+    """
+
+    def __init__(self, path: str = WEB_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS searches ("
+                "query TEXT NOT NULL, num_results INTEGER NOT NULL, results TEXT NOT NULL, "
+                "fetched_at REAL NOT NULL, PRIMARY KEY (query, num_results))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, text TEXT NOT NULL, "
+                "summary TEXT, fetched_at REAL NOT NULL, validated_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    # ----------------------------
+    # Search results
+    # ----------------------------
+    def get_search(self, query: str, num_results: int, now: Optional[float] = None) -> Optional[List[dict]]:
+        now = time.time() if now is None else now
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT results, fetched_at FROM searches WHERE query = ? AND num_results = ?",
+                (normalize_query(query), num_results)
+            ).fetchone()
+        if row is None or now - row[1] >= SEARCH_TTL_SECONDS:
+            return None
+        return json.loads(row[0])
+
+    def put_search(self, query: str, num_results: int, results: List[dict], now: Optional[float] = None):
+        now = time.time() if now is None else now
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO searches (query, num_results, results, fetched_at) VALUES (?, ?, ?, ?)",
+                (normalize_query(query), num_results, json.dumps(results), now)
+            )
+            conn.execute("DELETE FROM searches WHERE fetched_at < ?", (now - SEARCH_TTL_SECONDS,))
+            conn.commit()
+
+    # ----------------------------
+    # Pages
+    # ----------------------------
+    def get_page(self, url: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT etag, last_modified, text, summary, fetched_at, validated_at FROM pages WHERE url = ?",
+                (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("etag", "last_modified", "text", "summary", "fetched_at", "validated_at")
+        return dict(zip(keys, row))
+
+    def is_fresh(self, page: Dict[str, Any], now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        return now - page["validated_at"] < PAGE_FRESH_SECONDS
+
+    def put_page(self, url: str, text: str, etag: Optional[str] = None,
+                 last_modified: Optional[str] = None, now: Optional[float] = None):
+        """Store a freshly downloaded page; any summary of the previous version is dropped."""
+        now = time.time() if now is None else now
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO pages (url, etag, last_modified, text, summary, fetched_at, validated_at) "
+                "VALUES (?, ?, ?, ?, NULL, ?, ?)",
+                (url, etag, last_modified, text, now, now)
+            )
+            conn.execute("DELETE FROM pages WHERE validated_at < ?", (now - PAGE_MAX_AGE_SECONDS,))
+            conn.commit()
+
+    def touch_page(self, url: str, now: Optional[float] = None):
+        """Record a successful revalidation (304 Not Modified)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            conn = self._connect()
+            conn.execute("UPDATE pages SET validated_at = ? WHERE url = ?", (now, url))
+            conn.commit()
+
+    def put_summary(self, url: str, summary: str):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("UPDATE pages SET summary = ? WHERE url = ?", (summary, url))
+            conn.commit()
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM searches")
+            conn.execute("DELETE FROM pages")
+            conn.commit()
+
+_cache = WebCache()
+
+def get_web_cache() -> WebCache:
+    return _cache
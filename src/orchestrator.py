@@ -1,37 +1,74 @@
 # orchestrator.py
 
+import argparse
 import json
+import queue
+import threading
+import time
 import traceback
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Iterator, Optional
 from agents.planner_agent import handle_csv_upload, select_tools, generate_answer
-from agents.context_memory import get_context_text
+from agents.prefetch import start_prefetch
+from agents.context_memory import drop_session, get_context_text, use_session
+from helpers.llm_client import cache_stats
+from helpers.llm_scheduler import CancelScope, LLMCancelled, run_cancellable
+from helpers.model_config import warm_up_models
+from helpers.singleflight import batch_memo, dedupe_stats, request_memo
+from helpers.tracing import enable_tracing, log_status, span
 
-def log_status(stage: str, message: str):
-    """Prints formatted debug messages for visibility."""
-    print(f"[DEBUG] [{stage}] {message}")
+def process_csv_and_question(file_path: Optional[str], question: str, parallel: bool = True,
+                             on_answer_chunk: Optional[Callable[[str], None]] = None,
+                             session_id: Optional[str] = None):
+    """
+    Answer one question, optionally about a CSV. With a session_id, context memory is
+    read from and saved to that session only; otherwise the current (default) session is used.
+    """
+    if session_id is not None:
+        with use_session(session_id):
+            return process_csv_and_question(file_path, question, parallel, on_answer_chunk)
+    # request_memo: searches, pages and quotes fetched early (see agents.prefetch) are reused
+    with span("process_csv_and_question", question_chars=len(question), csv=file_path), request_memo():
+        return _process_csv_and_question(file_path, question, parallel, on_answer_chunk)
 
-def process_csv_and_question(file_path: str, question: str):
+def _process_csv_and_question(file_path: Optional[str], question: str, parallel: bool,
+                              on_answer_chunk: Optional[Callable[[str], None]]):
     try:
         log_status("0% COMPLETED", f"Starting process for question: '{question}'")
-        log_status("0% COMPLETED", f"Loading CSV from {file_path}")
-        csv_data = handle_csv_upload(file_path)
-        log_status("10% COMPLETED", "CSV successfully loaded")
+        if file_path:
+            log_status("0% COMPLETED", f"Loading CSV from {file_path}")
+            with span("load_csv"):
+                csv_data = handle_csv_upload(file_path)
+            log_status("10% COMPLETED", "CSV successfully loaded")
+        else:
+            csv_data = None
+            log_status("10% COMPLETED", "No CSV provided")
 
         log_status("10% COMPLETED", "Selecting tools based on question and CSV data")
-        tools_used = select_tools(question, csv_data)
-        log_status("30% COMPLETED", f"Tools selected: {[t.tool for t in tools_used.tools]}")
+        with span("select_tools") as s:
+            prefetch = start_prefetch(question, csv_data)
+            try:
+                tools_used = select_tools(question, csv_data)
+            except BaseException:
+                if prefetch is not None:
+                    prefetch.cancel()
+                raise
+            s.set(route=tools_used.route, tools=[t.tool for t in tools_used.tools])
+            if prefetch is not None:
+                s.set(prefetch=prefetch.settle(tools_used))
+        log_status("30% COMPLETED", f"Tools selected by {tools_used.route} planner: {[t.tool for t in tools_used.tools]}")
 
         log_status("30% COMPLETED", "Generating final answer using selected tools")
 
-        # ---
-
-        final_answer = generate_answer(question, tools_used, csv_data)
-
-        # ---
+        with span("generate_answer"):
+            final_answer = generate_answer(question, tools_used, csv_data, parallel=parallel,
+                                           on_answer_chunk=on_answer_chunk)
 
         log_status("90% COMPLETED", "Final answer generated successfully")
 
         log_status("90% COMPLETED", "Retrieving context memory")
-        context_text = get_context_text()
+        context_text = get_context_text(question)
 
         result = {
             "tools_used": tools_used.dict(),
@@ -39,15 +76,174 @@ def process_csv_and_question(file_path: str, question: str):
             "context_memory": context_text
         }
 
+        log_status("100% COMPLETED", f"LLM cache stats: {cache_stats()}")
         log_status("100% COMPLETED", "Process completed successfully")
         return result
 
+    except LLMCancelled as e:
+        log_status("CANCELLED", str(e))
+        return {"error": str(e)}
     except Exception as e:
         log_status("ERROR", f"An error occurred: {e}")
         traceback.print_exc()
         return {"error": str(e)}
 
+def stream_csv_and_question(file_path: str, question: str, parallel: bool = True,
+                            session_id: Optional[str] = None) -> Iterator[dict]:
+    """
+    Generator form of process_csv_and_question. Yields {"type": "answer_delta", "text": ...}
+    events while the final answer is being generated, then one {"type": "result", "result": ...}.
+    Closing the generator early cancels the run's outstanding LLM requests.
+    """
+    events: "queue.Queue[dict]" = queue.Queue()
+    scope = CancelScope("stream")
+
+    def run():
+        result = process_csv_and_question(
+            file_path, question, parallel=parallel,
+            on_answer_chunk=lambda text: events.put({"type": "answer_delta", "text": text}),
+            session_id=session_id
+        )
+        events.put({"type": "result", "result": result})
+
+    threading.Thread(target=run_cancellable, args=(scope, run), daemon=True).start()
+    finished = False
+    try:
+        while not finished:
+            event = events.get()
+            finished = event["type"] == "result"
+            yield event
+    finally:
+        if not finished:
+            scope.cancel("stream closed by consumer")
+
+# ----------------------------
+# Batch mode
+# ----------------------------
+BATCH_WORKERS = 4
+
+def _read_batch_items(input_path: str) -> Iterator[dict]:
+    """
+    Stream items from a JSONL file:
+    {"question": ..., "file_path": optional CSV, "id": optional, "session_id": optional}.
+    """
+    with open(input_path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield {"id": line_no, "error": f"Invalid JSON on line {line_no}: {e}"}
+                continue
+            if not isinstance(item, dict):
+                yield {"id": line_no, "error": f"Line {line_no} is not a JSON object"}
+                continue
+            item.setdefault("id", item.get("request_id", line_no))
+            error = _batch_item_error(item)
+            if error:
+                yield {"id": item["id"], "error": error}
+                continue
+            yield item
+
+def _batch_item_error(item: dict) -> Optional[str]:
+    if not isinstance(item.get("question"), str) or not item["question"].strip():
+        return "Missing 'question' (a non-empty string)"
+    for field in ("file_path", "session_id"):
+        if item.get(field) is not None and not isinstance(item[field], str):
+            return f"'{field}' must be a string"
+    return None
+
+def _process_batch_item(item: dict, default_file_path: Optional[str]) -> dict:
+    start = time.perf_counter()
+    if "error" in item:
+        return {"id": item["id"], "error": item["error"]}
+
+    # Items without a session_id get a throwaway session of their own: their prompts must not
+    # depend on which other items finished first, nor land in the CLI's persistent history
+    session_id = item.get("session_id") or f"batch-{uuid.uuid4().hex}"
+    try:
+        with span("batch_item", item_id=item["id"]):
+            result = process_csv_and_question(item.get("file_path") or default_file_path, item["question"],
+                                              session_id=session_id)
+    except Exception as e:
+        # One bad item must not abort the rest of the batch
+        log_status("ERROR", f"Batch item {item['id']} failed: {e}")
+        return {"id": item["id"], "error": str(e)}
+    finally:
+        if not item.get("session_id"):
+            drop_session(session_id)
+    result.pop("context_memory", None)
+    return {
+        "id": item["id"],
+        "question": item["question"],
+        **result,
+        "elapsed_seconds": round(time.perf_counter() - start, 3),
+    }
+
+def run_batch(input_path: str, output_path: str, max_workers: int = BATCH_WORKERS,
+              default_file_path: Optional[str] = None) -> dict:
+    """
+    Answer every question in a JSONL file with bounded concurrency, appending each result
+    to output_path as soon as it is ready (completion order; each line carries its "id").
+    Loaded CSVs, quotes and LLM responses are shared between items, and identical
+    sub-requests (same tickers, same search query, same prompt) run once per batch.
+    """
+    started = time.perf_counter()
+    processed = 0
+    with batch_memo(), ThreadPoolExecutor(max_workers=max_workers) as pool, \
+            open(output_path, "w", encoding="utf-8") as out:
+        pending = set()
+
+        def drain(return_when):
+            nonlocal pending, processed
+            done, pending = wait(pending, return_when=return_when)
+            for future in done:
+                out.write(json.dumps(future.result(), ensure_ascii=False, default=str) + "\n")
+                processed += 1
+            out.flush()
+
+        for item in _read_batch_items(input_path):
+            # Only read ahead a little, so huge input files are never held in memory
+            if len(pending) >= max_workers * 2:
+                drain(FIRST_COMPLETED)
+            pending.add(pool.submit(_process_batch_item, item, default_file_path))
+        while pending:
+            drain(FIRST_COMPLETED)
+
+    elapsed = time.perf_counter() - started
+    summary = {
+        "questions": processed,
+        "elapsed_seconds": round(elapsed, 3),
+        "questions_per_minute": round(processed / elapsed * 60, 2) if elapsed else 0.0,
+        "deduplicated_calls": dedupe_stats(),
+        "llm_cache": cache_stats(),
+    }
+    log_status("BATCH", f"Batch complete: {summary}")
+    return summary
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Multi-agent question answering over CSV data, stock APIs and the web.")
+    parser.add_argument("--batch", metavar="INPUT_JSONL", help="Answer every question in a JSONL file")
+    parser.add_argument("--output", metavar="OUTPUT_JSONL", default="batch_results.jsonl",
+                        help="Where batch results are written (default: batch_results.jsonl)")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="Questions processed concurrently")
+    parser.add_argument("--csv", metavar="FILE", default=None,
+                        help="CSV used for batch items that don't set their own file_path")
+    parser.add_argument("--trace", metavar="FILE", default=None,
+                        help="Record per-stage spans and write them at exit (*.json: Chrome trace, else JSON lines)")
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = _parse_args()
+    if args.trace:
+        enable_tracing(args.trace)
+    warm_up_models()
+    if args.batch:
+        run_batch(args.batch, args.output, max_workers=args.workers, default_file_path=args.csv)
+        raise SystemExit(0)
+
     file_path = "data/sales_data.csv"
     question = (
         "Based on the sales data, benchmark this against our competitors "
@@ -56,7 +252,10 @@ if __name__ == "__main__":
         "to provide a comprehensive summary."
     )
 
-    result = process_csv_and_question(file_path, question)
+    print("\n=== STREAMING ANSWER ===")
+    result = process_csv_and_question(
+        file_path, question, on_answer_chunk=lambda text: print(text, end="", flush=True)
+    )
     print("\n=== FINAL OUTPUT ===")
     # print(json.dumps(result, indent=4, ensure_ascii=False))
 
@@ -0,0 +1,465 @@
+# server.py
+#
+# Long-running HTTP service around process_csv_and_question, so an always-on process
+# (with pandas, yfinance, the caches and pooled connections already loaded) answers
+# questions for many users at once:
+#
+#   python src/server.py --port 8000 --concurrency 4 --queue 16
+#
+#   POST   /upload                  raw CSV body              -> {"file_id": ...}
+#   POST   /ask                     {"question", "file_id"?, "session_id"?, "stream"?}
+#   GET    /sessions/<id>/context   the session's context memory
+#   DELETE /sessions/<id>           forget a session
+#   GET    /health                  load and admission counters
+
+import argparse
+import asyncio
+import hashlib
+import http
+import json
+import os
+import re
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import unquote, urlsplit
+from orchestrator import process_csv_and_question
+from agents.context_memory import drop_session, get_memory
+from helpers.llm_scheduler import CancelScope, run_cancellable, scheduler_stats
+from helpers.tracing import bind, enable_tracing, log_status, span
+
+HOST = os.getenv("AGENT_HOST", "127.0.0.1")
+PORT = int(os.getenv("AGENT_PORT", "8000"))
+# Pipelines running at once; each one fans out to the shared Ollama backend
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "4"))
+# Requests allowed to wait for a slot; beyond this they are rejected with 503
+MAX_QUEUED_REQUESTS = int(os.getenv("MAX_QUEUED_REQUESTS", "16"))
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("REQUEST_TIMEOUT_SECONDS", "300"))
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(".cache", "uploads"))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(100 * 1024 * 1024)))
+MAX_JSON_BYTES = 1024 * 1024
+MAX_HEADER_BYTES = 64 * 1024
+BODY_CHUNK_BYTES = 64 * 1024
+RETRY_AFTER_SECONDS = 5
+
+FILE_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+# ----------------------------
+# Admission control
+# ----------------------------
+class Admission:
+    """
+    At most `limit` pipelines run at once and at most `max_queued` wait for a slot;
+    anything beyond that is rejected straight away rather than piling up behind Ollama.
+    """
+
+    def __init__(self, limit: int, max_queued: int):
+        self.limit = limit
+        self.max_queued = max_queued
+        self.running = 0
+        self.waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def acquire(self):
+        if self._semaphore.locked() and self.waiting >= self.max_queued:
+            self.rejected += 1
+            raise HTTPError(503, "Server is busy, retry later", {"Retry-After": str(RETRY_AFTER_SECONDS)})
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+
+    def release(self):
+        self.running -= 1
+        self.completed += 1
+        self._semaphore.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {"running": self.running, "waiting": self.waiting, "completed": self.completed,
+                "rejected": self.rejected, "limit": self.limit, "max_queued": self.max_queued}
+
+# ----------------------------
+# HTTP plumbing
+# ----------------------------
+class Request:
+    def __init__(self, method: str, target: str, headers: Dict[str, str], reader: asyncio.StreamReader):
+        url = urlsplit(target)
+        self.method = method
+        self.path = unquote(url.path)
+        self.headers = headers
+        self.reader = reader
+        self.body_consumed = False
+
+    @property
+    def content_length(self) -> int:
+        if "chunked" in self.headers.get("transfer-encoding", "").lower():
+            raise HTTPError(411, "Chunked request bodies are not supported; send Content-Length")
+        try:
+            return int(self.headers.get("content-length", "0"))
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length")
+
+    @property
+    def keep_alive(self) -> bool:
+        return self.headers.get("connection", "").lower() != "close"
+
+    def has_unread_body(self) -> bool:
+        if self.body_consumed:
+            return False
+        return "transfer-encoding" in self.headers or self.headers.get("content-length", "0").strip() not in ("", "0")
+
+    async def iter_body(self, max_bytes: int):
+        length = self.content_length
+        if length > max_bytes:
+            raise HTTPError(413, f"Request body larger than {max_bytes} bytes")
+        remaining = length
+        while remaining:
+            chunk = await self.reader.read(min(BODY_CHUNK_BYTES, remaining))
+            if not chunk:
+                raise HTTPError(400, "Request body ended early")
+            remaining -= len(chunk)
+            yield chunk
+        self.body_consumed = True
+
+    async def json(self) -> dict:
+        body = b"".join([chunk async for chunk in self.iter_body(MAX_JSON_BYTES)])
+        try:
+            payload = json.loads(body or b"{}")
+        except json.JSONDecodeError as e:
+            raise HTTPError(400, f"Invalid JSON body: {e}")
+        if not isinstance(payload, dict):
+            raise HTTPError(400, "JSON body must be an object")
+        return payload
+
+async def _read_request(reader: asyncio.StreamReader) -> Optional[Request]:
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if not e.partial.strip():
+            return None  # client closed an idle keep-alive connection
+        raise HTTPError(400, "Incomplete request head")
+    except asyncio.LimitOverrunError:
+        raise HTTPError(431, "Request head too large")
+
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _version = lines[0].split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+    return Request(method.upper(), target, headers, reader)
+
+def _head(status: int, headers: Dict[str, str]) -> bytes:
+    lines = [f"HTTP/1.1 {status} {http.HTTPStatus(status).phrase}"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+async def send_json(writer: asyncio.StreamWriter, status: int, payload: Any, keep_alive: bool = True,
+                    headers: Optional[Dict[str, str]] = None):
+    body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+    writer.write(_head(status, {
+        "Content-Type": "application/json",
+        "Content-Length": str(len(body)),
+        "Connection": "keep-alive" if keep_alive else "close",
+        **(headers or {}),
+    }) + body)
+    await writer.drain()
+
+class ChunkedWriter:
+    """NDJSON over chunked transfer encoding; drain() after every event applies backpressure."""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+
+    async def start(self, status: int = 200, headers: Optional[Dict[str, str]] = None):
+        self.writer.write(_head(status, {
+            "Content-Type": "application/x-ndjson",
+            "Transfer-Encoding": "chunked",
+            "Cache-Control": "no-cache",
+            **(headers or {}),
+        }))
+        await self.writer.drain()
+
+    async def send(self, event: dict):
+        data = (json.dumps(event, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+        self.writer.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        await self.writer.drain()
+
+    async def end(self):
+        self.writer.write(b"0\r\n\r\n")
+        await self.writer.drain()
+
+# ----------------------------
+# Service
+# ----------------------------
+class AgentServer:
+    def __init__(self, concurrency: int = MAX_CONCURRENT_REQUESTS, max_queued: int = MAX_QUEUED_REQUESTS,
+                 timeout: float = REQUEST_TIMEOUT_SECONDS, upload_dir: str = UPLOAD_DIR):
+        self.concurrency = concurrency
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.upload_dir = upload_dir
+        self.started = time.time()
+        self.admission: Optional[Admission] = None
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="pipeline")
+
+    async def serve(self, host: str = HOST, port: int = PORT):
+        # Created here so the semaphore belongs to the running loop
+        self.admission = Admission(self.concurrency, self.max_queued)
+        server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_HEADER_BYTES)
+        log_status("SERVER", f"Listening on http://{host}:{port} "
+                             f"(concurrency {self.concurrency}, queue {self.max_queued})")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except HTTPError as e:
+                    await send_json(writer, e.status, {"error": e.message}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                keep_alive = await self.dispatch(request, writer)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # client went away
+        finally:
+            writer.close()
+
+    async def dispatch(self, request: Request, writer: asyncio.StreamWriter) -> bool:
+        """Handle one request; returns whether the connection can be reused."""
+        with span("http.request", "server", method=request.method, path=request.path) as s:
+            try:
+                status = await self.route(request, writer)
+            except HTTPError as e:
+                status = e.status
+                await send_json(writer, e.status, {"error": e.message},
+                                keep_alive=request.keep_alive and not request.has_unread_body(), headers=e.headers)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                raise
+            except Exception as e:
+                status = 500
+                traceback.print_exc()
+                await send_json(writer, 500, {"error": str(e)}, keep_alive=False)
+            s.set(status=status)
+        # A body we never read would be parsed as the next request
+        return request.keep_alive and not request.has_unread_body()
+
+    async def route(self, request: Request, writer: asyncio.StreamWriter) -> int:
+        method, parts = request.method, [p for p in request.path.split("/") if p]
+        if parts == ["health"] and method == "GET":
+            return await self._reply(request, writer, 200, self.health())
+        if parts == ["ask"] and method == "POST":
+            return await self.handle_ask(request, writer)
+        if parts == ["upload"] and method == "POST":
+            return await self.handle_upload(request, writer)
+        if len(parts) == 3 and parts[0] == "sessions" and parts[2] == "context" and method == "GET":
+            return await self._reply(request, writer, 200,
+                                     {"session_id": parts[1], "context": get_memory(parts[1]).text()})
+        if len(parts) == 2 and parts[0] == "sessions" and method == "DELETE":
+            drop_session(parts[1])
+            return await self._reply(request, writer, 200, {"session_id": parts[1], "deleted": True})
+        known = parts[:1] in (["health"], ["ask"], ["upload"], ["sessions"])
+        raise HTTPError(405 if known else 404, f"No route for {method} {request.path}")
+
+    async def _reply(self, request: Request, writer: asyncio.StreamWriter, status: int, payload: Any) -> int:
+        await send_json(writer, status, payload, keep_alive=request.keep_alive)
+        return status
+
+    def health(self) -> dict:
+        return {"status": "ok", "uptime_seconds": round(time.time() - self.started, 1), **self.admission.stats(),
+                "llm": scheduler_stats()}
+
+    # ----------------------------
+    # Pipelines
+    # ----------------------------
+    async def run_pipeline(self, fn: Callable, *args) -> Any:
+        """
+        Run a blocking pipeline on the worker pool once admitted. Its slot is held until the
+        worker really finishes, even if the request times out, so Ollama is never oversubscribed.
+        """
+        await self.admission.acquire()
+        return await self._execute(fn, *args)
+
+    async def _execute(self, fn: Callable, *args) -> Any:
+        """
+        Run an admitted pipeline; the caller must already hold a slot. If the request times
+        out or its client goes away, the pipeline's pending LLM requests are cancelled.
+        """
+        scope = CancelScope("request")
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self._pool, bind(run_cancellable), scope, fn, *args)
+        except BaseException:
+            self.admission.release()
+            raise
+        future.add_done_callback(lambda _: self.admission.release())
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            scope.cancel(f"timed out after {self.timeout}s")
+            raise HTTPError(504, f"Request took longer than {self.timeout}s")
+        except asyncio.CancelledError:
+            scope.cancel("client disconnected")
+            raise
+
+    def _file_path(self, payload: dict) -> Optional[str]:
+        file_id = payload.get("file_id")
+        if not file_id:
+            return None
+        if not isinstance(file_id, str) or not FILE_ID_PATTERN.match(file_id):
+            raise HTTPError(400, "Invalid file_id")
+        path = os.path.join(self.upload_dir, f"{file_id}.csv")
+        if not os.path.exists(path):
+            raise HTTPError(404, f"Unknown file_id {file_id}")
+        return path
+
+    async def handle_ask(self, request: Request, writer: asyncio.StreamWriter) -> int:
+        payload = await request.json()
+        question = payload.get("question")
+        if not isinstance(question, str) or not question.strip():
+            raise HTTPError(400, "Missing 'question'")
+        file_path = self._file_path(payload)
+        session_id = str(payload.get("session_id") or request.headers.get("x-session-id") or uuid.uuid4().hex)
+
+        if payload.get("stream"):
+            return await self._stream_answer(request, writer, file_path, question, session_id)
+
+        result = await self.run_pipeline(process_csv_and_question, file_path, question, True, None, session_id)
+        result.pop("context_memory", None)
+        status = 500 if "error" in result else 200
+        return await self._reply(request, writer, status, {"session_id": session_id, **result})
+
+    async def _stream_answer(self, request: Request, writer: asyncio.StreamWriter,
+                             file_path: Optional[str], question: str, session_id: str) -> int:
+        loop = asyncio.get_running_loop()
+        events: "asyncio.Queue[dict]" = asyncio.Queue()
+
+        def on_answer_chunk(text: str):
+            loop.call_soon_threadsafe(events.put_nowait, {"type": "answer_delta", "text": text})
+
+        # Admitted before any bytes are sent, so a rejection is still a plain 503
+        await self.admission.acquire()
+        pipeline = asyncio.ensure_future(
+            self._execute(process_csv_and_question, file_path, question, True, on_answer_chunk, session_id)
+        )
+
+        stream = ChunkedWriter(writer)
+        try:
+            await stream.start(headers={"X-Session-Id": session_id})
+            await stream.send({"type": "session", "session_id": session_id})
+            while True:
+                getter = asyncio.ensure_future(events.get())
+                done, _ = await asyncio.wait({getter, pipeline}, return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    await stream.send(getter.result())
+                    continue
+                getter.cancel()
+                break
+            while not events.empty():
+                await stream.send(events.get_nowait())
+        except ConnectionError:
+            # Nobody is reading the answer any more: stop generating it
+            pipeline.cancel()
+            raise
+        try:
+            result = pipeline.result()
+            result.pop("context_memory", None)
+            await stream.send({"type": "result", "result": result})
+        except HTTPError as e:
+            await stream.send({"type": "error", "status": e.status, "error": e.message})
+        await stream.end()
+        return 200
+
+    # ----------------------------
+    # Uploads
+    # ----------------------------
+    async def handle_upload(self, request: Request, writer: asyncio.StreamWriter) -> int:
+        """
+        Store a raw CSV body under a content hash. Re-uploading the same file returns the
+        same file_id and path, so the CSV cache keeps its parsed copy.
+        """
+        os.makedirs(self.upload_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        tmp_path = os.path.join(self.upload_dir, f".upload-{uuid.uuid4().hex}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                async for chunk in request.iter_body(MAX_UPLOAD_BYTES):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+            if not size:
+                raise HTTPError(400, "Empty upload")
+            file_id = digest.hexdigest()[:32]
+            path = os.path.join(self.upload_dir, f"{file_id}.csv")
+            if not os.path.exists(path):
+                os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        log_status("SERVER", f"Stored upload {file_id} ({size} bytes)")
+        return await self._reply(request, writer, 201, {"file_id": file_id, "bytes": size})
+
+def warm_up():
+    """
+    Load the Ollama models and the tool modules, create the HTTP session and open the LLM cache up front
+    so the first request doesn't pay for them.
+    """
+    from agents.researcher_agent import get_http_session
+    from agents.tool_registry import load_tools
+    from helpers.llm_client import get_cache
+    from helpers.model_config import warm_up_models
+
+    start = time.perf_counter()
+    warm_up_models()
+    load_tools()
+    get_http_session()
+    get_cache().stats()
+    log_status("SERVER", f"Warm-up complete in {time.perf_counter() - start:.2f}s")
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="HTTP service for multi-agent question answering.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENT_REQUESTS,
+                        help="Questions processed at once")
+    parser.add_argument("--queue", type=int, default=MAX_QUEUED_REQUESTS,
+                        help="Questions allowed to wait before new ones get 503")
+    parser.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT_SECONDS, help="Per-request timeout (s)")
+    parser.add_argument("--trace", metavar="FILE", default=None,
+                        help="Record per-stage spans and write them at exit (*.json: Chrome trace, else JSON lines)")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = _parse_args()
+    if args.trace:
+        enable_tracing(args.trace)
+    warm_up()
+    try:
+        asyncio.run(AgentServer(args.concurrency, args.queue, args.timeout).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        log_status("SERVER", "Shutting down")